@@ -0,0 +1,87 @@
+import zipfile
+from collections import OrderedDict
+from pathlib import Path
+
+# single: every output in one ZIP, per_folder: one ZIP per folder value
+ARCHIVE_MODES = ('single', 'per_folder')
+
+# Name of the ZIP written in single mode
+ARCHIVE_NAME = 'documents.zip'
+
+# Archives kept open at once in per_folder mode, the least recently used one
+# is closed beyond that and reopened for appending when it is needed again
+MAX_OPEN_ARCHIVES = 64
+
+
+class ArchiveWriter:
+    """
+    Output files written straight into ZIP archives in the save location, with
+    the same folder/format/name layout as loose files. Every member is
+    streamed to disk as it is added, only the central directory is kept in
+    memory until the archive is closed. At most max_open archives are open at
+    a time, so a folder per recipient does not run out of file descriptors.
+    """
+
+    def __init__(self, save_location, mode='single', max_open=MAX_OPEN_ARCHIVES):
+        self.save_location = Path(save_location)
+        self.mode = mode
+        self.max_open = max_open
+        self.archives = {}  # Archive path -> open ZipFile, None once closed
+        self._open = OrderedDict()  # Paths of the open archives, least recently used first
+
+    def archive_path(self, folder_name):
+        """ZIP file that holds the outputs of a folder"""
+        if self.mode == 'per_folder':
+            return self.save_location / f"{folder_name}.zip"
+        return self.save_location / ARCHIVE_NAME
+
+    def member_name(self, folder_name, format_type, output_name):
+        return f"{folder_name}/{format_type}/{output_name}.{format_type}"
+
+    def output_paths(self, folder_name, output_name, formats):
+        """Where the outputs of a row end up, as archive path/member name"""
+        archive_path = self.archive_path(folder_name)
+        return [str(archive_path / self.member_name(folder_name, format_type, output_name))
+                for format_type in formats]
+
+    def _archive(self, folder_name):
+        archive_path = self.archive_path(folder_name)
+        archive = self.archives.get(archive_path)
+        if archive is not None:
+            self._open.move_to_end(archive_path)
+            return archive
+
+        if len(self._open) >= self.max_open:
+            oldest_path, _ = self._open.popitem(last=False)
+            self.archives[oldest_path].close()
+            self.archives[oldest_path] = None
+
+        # An archive closed to free its file is appended to, a new one replaces earlier runs'
+        if archive_path in self.archives:
+            archive = zipfile.ZipFile(archive_path, 'a')
+        else:
+            archive_path.parent.mkdir(parents=True, exist_ok=True)
+            archive = zipfile.ZipFile(archive_path, 'w')
+        self.archives[archive_path] = archive
+        self._open[archive_path] = None
+        return archive
+
+    def add_bytes(self, folder_name, format_type, output_name, data):
+        """Add an output held in memory"""
+        # .docx files are ZIP packages already, deflating them again gains nothing
+        compress_type = zipfile.ZIP_STORED if format_type == 'docx' else zipfile.ZIP_DEFLATED
+        self._archive(folder_name).writestr(
+            self.member_name(folder_name, format_type, output_name), data, compress_type=compress_type)
+
+    def add_file(self, folder_name, format_type, output_name, path):
+        """Add an output written to disk, copied in blocks"""
+        self._archive(folder_name).write(
+            path, self.member_name(folder_name, format_type, output_name),
+            compress_type=zipfile.ZIP_DEFLATED)
+
+    def close(self):
+        """Write the central directory of every archive opened so far"""
+        for archive_path in self._open:
+            self.archives[archive_path].close()
+            self.archives[archive_path] = None
+        self._open.clear()
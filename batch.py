@@ -0,0 +1,206 @@
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from metrics import RunMetrics
+from render import CompiledTemplate
+from render_cache import link_or_copy
+from splice import SpliceTemplate, TemplateCompileError
+
+# Rendering engines: python-docx object model or byte splicing of document.xml
+RENDER_ENGINES = ('docx', 'splice')
+
+# Number of rows sent to a worker process at a time
+DEFAULT_CHUNK_SIZE = 50
+
+# Template and job settings of the current worker process
+_worker_state = {}
+
+
+def output_paths(save_location, folder_name, output_name, formats):
+    """Paths of the files a row produces, one per selected format"""
+    record_base_dir = Path(save_location) / folder_name
+    return [str(record_base_dir / format_type / f"{output_name}.{format_type}")
+            for format_type in formats]
+
+
+def process_row(compiled_template, index, output_name, folder_name, values, save_location, formats,
+                metrics, in_memory=False):
+    """
+    Render one prepared row and save it in every selected format, timing each
+    step in metrics. Returns (output_name, error, pending_pdf, docx_data) where
+    error is None on success and pending_pdf is the .docx waiting for
+    convert_pdfs, if PDF output is selected. With in_memory the .docx is not
+    written but returned as docx_data, for archives and merged documents.
+    """
+    try:
+        with metrics.time('row'):
+            # Fill the compiled template with this row's values
+            with metrics.time('replace'):
+                doc = compiled_template.render(values)
+
+            # Create format-specific subdirectories
+            with metrics.time('mkdir'):
+                record_base_dir = Path(save_location) / folder_name
+                output_dirs = {}
+                for format_type in formats:
+                    if in_memory and format_type == "docx":
+                        continue
+                    output_dir = record_base_dir / format_type
+                    output_dir.mkdir(parents=True, exist_ok=True)
+                    output_dirs[format_type] = output_dir
+
+            with metrics.time('save'):
+                # Serialize once and reuse the same bytes for every format
+                data = doc.to_bytes()
+
+                # Save in selected formats
+                docx_path = None
+                docx_data = None
+                if "docx" in formats and in_memory:
+                    docx_data = data
+                elif "docx" in formats:
+                    docx_path = output_dirs["docx"] / f"{output_name}.docx"
+                    # The file may be a link shared with deduplicated rows of an earlier run
+                    docx_path.unlink(missing_ok=True)
+                    docx_path.write_bytes(data)
+
+                # Save the docx next to its PDF target, converted later in one batch per folder
+                pending_pdf = None
+                if "pdf" in formats:
+                    pending_pdf = output_dirs["pdf"] / f"{output_name}.docx"
+                    link_or_copy(docx_path, pending_pdf, data)
+                    pending_pdf = str(pending_pdf)
+
+        metrics.count('rows_rendered')
+        metrics.count('bytes_rendered', len(data))
+        return output_name, None, pending_pdf, docx_data
+
+    except Exception as row_error:
+        metrics.count('rows_failed')
+        return output_name, str(row_error), None, None
+
+
+def compile_template(template_path, mapping, keyword_symbols, keyword_formats, render_engine='docx',
+                     metrics=None):
+    """
+    Compile the template for the selected rendering engine. Templates the
+    splice engine cannot handle fall back to the python-docx engine, counted
+    as engine_fallbacks in metrics.
+    """
+    if render_engine == 'splice':
+        try:
+            return SpliceTemplate(template_path, mapping, keyword_symbols, keyword_formats)
+        except TemplateCompileError as compile_error:
+            # stdout may carry the JSON summary of the command line
+            print(f"Warning: falling back to the docx engine: {str(compile_error)}", file=sys.stderr)
+            if metrics is not None:
+                metrics.count('engine_fallbacks')
+    return CompiledTemplate(template_path, mapping, keyword_symbols, keyword_formats)
+
+
+def _init_worker(template_path, mapping, keyword_symbols, keyword_formats, render_engine, job):
+    """Compile the template once in each worker process"""
+    metrics = RunMetrics()
+    with metrics.time('compile'):
+        _worker_state['template'] = compile_template(
+            template_path, mapping, keyword_symbols, keyword_formats, render_engine, metrics)
+    _worker_state['job'] = job
+    _worker_state['metrics'] = metrics
+
+
+def _process_chunk(chunk):
+    """
+    Process a chunk of prepared rows inside a worker process.
+    Returns the results and the metrics gathered since the last chunk.
+    """
+    template = _worker_state['template']
+    job = _worker_state['job']
+    metrics = _worker_state['metrics']
+    results = [(row[0],) + process_row(template, *row, **job, metrics=metrics) for row in chunk]
+    return results, metrics.take()
+
+
+def chunked(rows, chunk_size):
+    """Split an iterable of rows into lists of at most chunk_size rows"""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def render_rows(rows, template_path, mapping, keyword_symbols, keyword_formats, job,
+                workers=1, chunk_size=DEFAULT_CHUNK_SIZE, render_engine='docx', metrics=None):
+    """
+    Render prepared (index, output_name, folder_name, values) rows and yield
+    (index, output_name, error, pending_pdf, docx_data) in row order.
+    job holds the keyword arguments of process_row (save_location, formats, in_memory).
+    With more than one worker the rows are sent in chunks to a process pool
+    where every worker keeps its own compiled template. Timings of every
+    process are gathered in metrics.
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+
+    if workers <= 1:
+        with metrics.time('compile'):
+            compiled_template = compile_template(
+                template_path, mapping, keyword_symbols, keyword_formats, render_engine, metrics)
+        for row in rows:
+            yield (row[0],) + process_row(compiled_template, *row, **job, metrics=metrics)
+        return
+
+    chunks = chunked(rows, chunk_size)
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(template_path, mapping, keyword_symbols, keyword_formats,
+                      render_engine, job)) as executor:
+        # Keep a bounded number of chunks in flight and collect them in order
+        pending = deque(executor.submit(_process_chunk, chunk)
+                        for chunk in islice(chunks, workers * 2))
+        while pending:
+            results, worker_metrics = pending.popleft().result()
+            metrics.merge(worker_metrics)
+            for chunk in islice(chunks, 1):
+                pending.append(executor.submit(_process_chunk, chunk))
+            yield from results
+
+
+def convert_pdfs(pending_pdfs, converter, metrics=None):
+    """
+    Convert the (key, docx_path) pairs left by render_rows with one converter
+    call per pdf folder. Yields (key, error) for every file, key being
+    whatever the caller uses to identify the row.
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+
+    by_folder = {}
+    for key, docx_path in pending_pdfs:
+        docx_path = Path(docx_path)
+        by_folder.setdefault(docx_path.parent, []).append((key, docx_path))
+
+    for pdf_dir, files in by_folder.items():
+        docx_paths = [docx_path for _, docx_path in files]
+
+        # Stale PDFs from an earlier run would hide conversion failures
+        for docx_path in docx_paths:
+            docx_path.with_suffix('.pdf').unlink(missing_ok=True)
+
+        try:
+            with metrics.time('pdf_convert'):
+                failures = converter.convert_batch(docx_paths, pdf_dir)
+        except Exception as pdf_error:
+            failures = {docx_path: str(pdf_error) for docx_path in docx_paths}
+        metrics.count('pdf_files', len(docx_paths))
+
+        for key, docx_path in files:
+            error = failures.get(docx_path)
+            if not error:
+                # Remove temporary docx file after successful PDF conversion
+                docx_path.unlink()
+            yield key, error
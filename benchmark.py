@@ -0,0 +1,333 @@
+"""
+Reproducible benchmark of keyword detection, placeholder matching and
+rendering, on synthetic templates and data files.
+
+Example:
+    python benchmark.py --rows 100 10000 --data-formats csv xlsx \
+        --engines docx splice --placeholders 10 50 --output results.json
+
+    python benchmark.py --rows 10000 --baseline results.json
+
+Every case runs in a fresh process so its peak memory is its own. Results
+are saved as JSON; with --baseline every case is compared against the case
+of the same name and the exit code is 1 when one of them regressed by more
+than --threshold (rows/sec, p99 latency or peak memory).
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import platform
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from docx import Document
+from docx.oxml import parse_xml
+from docx.shared import Inches
+from openpyxl import Workbook
+from batch import RENDER_ENGINES
+from data_source import open_data_source
+from engine import KEYWORD_SYMBOLS, RenderJob, detect_template_keywords, template_text
+from matching import ColumnMatcher
+from render import KeywordMatcher
+
+TEMPLATE_FEATURES = ('tables', 'textboxes', 'images', 'headers')
+DATA_FORMATS = ('csv', 'xlsx')
+
+# Rows of the generated data files are spread over this many output folders
+FOLDER_COUNT = 10
+
+# A text box as Word writes it in VML, with {text} as its only paragraph
+_TEXT_BOX = (
+    '<w:r xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    ' xmlns:v="urn:schemas-microsoft-com:vml">'
+    '<w:pict><v:shape style="width:240pt;height:40pt"><v:textbox><w:txbxContent>'
+    '<w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+    '</w:txbxContent></v:textbox></v:shape></w:pict></w:r>')
+
+
+def placeholder(number):
+    """Placeholder for keyword number, cycling through every supported symbol pair"""
+    start_symbol, end_symbol = KEYWORD_SYMBOLS[number % len(KEYWORD_SYMBOLS)]
+    return f"{start_symbol}{number}{end_symbol or ''}"
+
+
+def _png_bytes(size, seed):
+    """An RGB noise image, incompressible so it weighs on the package like a photo"""
+    rng = random.Random(seed)
+    raw = b''.join(b'\x00' + rng.randbytes(size * 3) for _ in range(size))
+    chunks = []
+    for tag, data in ((b'IHDR', struct.pack('>2I5B', size, size, 8, 2, 0, 0, 0)),
+                      (b'IDAT', zlib.compress(raw)), (b'IEND', b'')):
+        chunks.append(struct.pack('>I', len(data)) + tag + data
+                      + struct.pack('>I', zlib.crc32(tag + data)))
+    return b'\x89PNG\r\n\x1a\n' + b''.join(chunks)
+
+
+def make_template(path, placeholders, features, seed=0):
+    """
+    Write a template with keywords 1..placeholders spread over body paragraphs
+    and, depending on features, nested tables, text boxes and headers/footers.
+    """
+    doc = Document()
+    numbers = list(range(1, placeholders + 1))
+    # Keywords are shared out between the locations that are enabled
+    locations = ['body'] + [feature for feature in ('tables', 'textboxes', 'headers') if feature in features]
+    by_location = {location: numbers[i::len(locations)] for i, location in enumerate(locations)}
+
+    for number in by_location['body']:
+        doc.add_paragraph(f"Field {number}: {placeholder(number)} end of line.")
+
+    if 'tables' in features:
+        table = doc.add_table(rows=1, cols=2)
+        table.cell(0, 0).text = "Outer cell"
+        nested = table.cell(0, 1).add_table(rows=1, cols=1)
+        inner = nested.cell(0, 0).add_table(rows=len(by_location['tables']) or 1, cols=1)
+        for row, number in enumerate(by_location['tables']):
+            inner.cell(row, 0).text = f"Cell {placeholder(number)} value"
+
+    if 'textboxes' in features:
+        for number in by_location['textboxes']:
+            paragraph = doc.add_paragraph()
+            paragraph._p.append(parse_xml(_TEXT_BOX.format(text=f"Box {placeholder(number)} text")))
+
+    if 'headers' in features:
+        section = doc.sections[0]
+        header_numbers = by_location['headers']
+        half = len(header_numbers) // 2
+        section.header.paragraphs[0].text = " ".join(
+            f"Header {placeholder(number)} ." for number in header_numbers[:half])
+        section.footer.paragraphs[0].text = " ".join(
+            f"Footer {placeholder(number)} ." for number in header_numbers[half:])
+
+    if 'images' in features:
+        doc.add_picture(io.BytesIO(_png_bytes(256, seed)), width=Inches(2))
+
+    doc.save(path)
+
+
+def make_dataset(path, rows, placeholders, data_format, seed=0):
+    """Write a list file with Name, Folder and field_1..field_N columns"""
+    rng = random.Random(seed)
+    header = ['Name', 'Folder'] + [f"field_{number}" for number in range(1, placeholders + 1)]
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(8)) for _ in range(1000)]
+
+    def data_rows():
+        for row in range(rows):
+            yield ([f"Person {row}", f"group {row % FOLDER_COUNT}"]
+                   + [words[(row * 31 + number * 7) % len(words)] + str(row)
+                      for number in range(1, placeholders + 1)])
+
+    if data_format == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as data_file:
+            writer = csv.writer(data_file)
+            writer.writerow(header)
+            writer.writerows(data_rows())
+    else:
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet()
+        worksheet.append(header)
+        for values in data_rows():
+            worksheet.append(values)
+        workbook.save(path)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def run_case(case):
+    """Run one benchmark case, in its own process"""
+    template_path = case['template']
+
+    # Keyword detection, uncached since the process is new
+    start = time.perf_counter()
+    keywords, keyword_symbols = detect_template_keywords(template_path)
+    detect_seconds = time.perf_counter() - start
+
+    mapping = {keyword: f"field_{keyword}" for keyword in keywords}
+
+    # Placeholder matching: build the matcher and scan every paragraph once
+    start = time.perf_counter()
+    matcher = KeywordMatcher(mapping, keyword_symbols)
+    matched_lines = sum(1 for line in template_text(template_path).split('\n') if matcher.search(line))
+    match_seconds = time.perf_counter() - start
+
+    # Keyword to column matching against the header of the data file
+    columns = open_data_source(case['data']).columns
+    start = time.perf_counter()
+    column_matches = ColumnMatcher(columns).match_all(keywords)
+    column_match_seconds = time.perf_counter() - start
+
+    output_dir = Path(case['output_dir'])
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+    # Time between consecutive rows, with one worker this is the per-row latency
+    intervals = []
+    last = [time.perf_counter()]
+
+    def progress(stage, done, total):
+        if stage == 'render':
+            now = time.perf_counter()
+            intervals.append(now - last[0])
+            last[0] = now
+
+    job = RenderJob(
+        template_path, case['data'], mapping, keyword_symbols, output_dir,
+        formats=case['formats'], workers=case['workers'], converter=case['converter'],
+        render_engine=case['engine'], dedupe=False)
+    start = time.perf_counter()
+    summary = job.run(progress=progress)
+    render_seconds = time.perf_counter() - start
+    with open(summary['report'], encoding='utf-8') as report_file:
+        report = json.load(report_file)
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+    # The first row also waits for the template to compile
+    intervals = sorted(intervals[1:])
+    peak_rss = report['peak_rss_bytes']
+    if peak_rss is not None and report['peak_rss_children_bytes']:
+        peak_rss = max(peak_rss, report['peak_rss_children_bytes'])
+    return {
+        'name': case['name'],
+        'rows': case['rows'],
+        'data_format': case['data_format'],
+        'placeholders': case['placeholders'],
+        'detected_keywords': len(keywords),
+        'matched_lines': matched_lines,
+        'matched_columns': len(column_matches),
+        'engine': case['engine'],
+        'workers': case['workers'],
+        'formats': case['formats'],
+        'successful': summary['successful'],
+        'failed': len(summary['failed']),
+        'detect_seconds': round(detect_seconds, 6),
+        'match_seconds': round(match_seconds, 6),
+        'column_match_seconds': round(column_match_seconds, 6),
+        'render_seconds': round(render_seconds, 6),
+        'rows_per_sec': round(case['rows'] / render_seconds, 2) if render_seconds else 0.0,
+        'p50_ms': round(percentile(intervals, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(intervals, 0.99) * 1000, 3),
+        'peak_rss_bytes': peak_rss,
+        'stages': {stage: data['total_seconds'] for stage, data in report['stages'].items()},
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return a line for every case that regressed against the baseline"""
+    baseline_cases = {case['name']: case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        old = baseline_cases.get(case['name'])
+        if not old:
+            continue
+        if old['rows_per_sec'] and case['rows_per_sec'] < old['rows_per_sec'] * (1 - threshold):
+            regressions.append(
+                f"{case['name']}: rows/sec {old['rows_per_sec']} -> {case['rows_per_sec']}")
+        if old['p99_ms'] and case['p99_ms'] > old['p99_ms'] * (1 + threshold):
+            regressions.append(f"{case['name']}: p99 {old['p99_ms']} ms -> {case['p99_ms']} ms")
+        if old.get('peak_rss_bytes') and case.get('peak_rss_bytes') and \
+                case['peak_rss_bytes'] > old['peak_rss_bytes'] * (1 + threshold):
+            regressions.append(
+                f"{case['name']}: peak memory {old['peak_rss_bytes']} -> {case['peak_rss_bytes']} bytes")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark detection, matching and rendering")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000],
+                        help="Data file sizes, from 100 up to 1000000 rows")
+    parser.add_argument('--data-formats', nargs='+', choices=DATA_FORMATS, default=['csv'])
+    parser.add_argument('--placeholders', type=int, nargs='+', default=[10],
+                        help="Placeholders per template")
+    parser.add_argument('--features', nargs='*', choices=TEMPLATE_FEATURES,
+                        default=list(TEMPLATE_FEATURES), help="Template content besides body paragraphs")
+    parser.add_argument('--engines', nargs='+', choices=RENDER_ENGINES, default=list(RENDER_ENGINES))
+    parser.add_argument('--workers', type=int, nargs='+', default=[1])
+    parser.add_argument('--pdf', action='store_true', help="Also convert to PDF")
+    parser.add_argument('--converter', help="PDF converter backend, with --pdf")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the generated content")
+    parser.add_argument('--work-dir', help="Where inputs and outputs are generated (default: temporary)")
+    parser.add_argument('--output', default='benchmark_results.json', help="Results file")
+    parser.add_argument('--baseline', help="Earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Relative change counted as a regression (default: 0.10)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix='docgen_bench_'))
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    try:
+        # Inputs are generated once and shared by the cases using them
+        cases = []
+        for placeholders in args.placeholders:
+            template = work_dir / f"template_{placeholders}.docx"
+            make_template(template, placeholders, args.features, args.seed)
+            for rows in args.rows:
+                for data_format in args.data_formats:
+                    data = work_dir / f"data_{rows}_{placeholders}.{data_format}"
+                    if not data.exists():
+                        print(f"Generating {data.name}...", file=sys.stderr)
+                        make_dataset(data, rows, placeholders, data_format, args.seed)
+                    for engine in args.engines:
+                        for workers in args.workers:
+                            name = f"{data_format}-{rows}rows-{placeholders}ph-{engine}-{workers}w"
+                            cases.append({
+                                'name': name, 'template': str(template), 'data': str(data),
+                                'rows': rows, 'data_format': data_format,
+                                'placeholders': placeholders, 'engine': engine, 'workers': workers,
+                                'formats': ['docx', 'pdf'] if args.pdf else ['docx'],
+                                'converter': args.converter,
+                                'output_dir': str(work_dir / f"out_{name}"),
+                            })
+
+        results = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'features': args.features,
+            'seed': args.seed,
+            'cases': [],
+        }
+        for case in cases:
+            print(f"Running {case['name']}...", file=sys.stderr)
+            # A fresh process per case, so peak memory does not carry over
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                result = executor.submit(run_case, case).result()
+            results['cases'].append(result)
+            print(f"  {result['rows_per_sec']} rows/sec, p50 {result['p50_ms']} ms, "
+                  f"p99 {result['p99_ms']} ms, peak {result['peak_rss_bytes']} bytes", file=sys.stderr)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results saved to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Headless batch entry point, runs a job without creating any window.
+
+Example:
+    python cli.py --template letter.docx --list data.csv --config job.json \
+        --output-dir out --output-formats pdf docx --workers 8
+
+The config file holds the keyword to column mapping and optional formats:
+    {"mapping": {"1": "First Name"}, "keyword_formats": {"1": {"font_name": "Arial", ...}}}
+
+Every run writes render_manifest.jsonl in the output directory. Rerunning
+with --resume skips rows whose outputs are already up to date, --retry-failed
+only renders the rows that failed last time.
+
+--archive single streams every output into documents.zip in the output
+directory instead of writing loose files, --archive per_folder writes one
+<folder>.zip per folder value. Archives cannot be resumed.
+
+--merge page (or section) appends every row to a single merged.docx/.pdf
+instead, --volume-size K starts a new merged_NNNN file every K rows.
+
+Stage timings, counters and peak memory are saved in render_report.json in
+the output directory (--prometheus-file also writes them for node_exporter),
+--profile cprofile or pyinstrument saves a profile of the run next to it.
+
+A JSON summary is printed to stdout. The exit code is 0 when every row
+succeeded, 1 when some rows failed and 2 when the job could not run.
+"""
+import argparse
+import json
+import sys
+from archive import ARCHIVE_MODES
+from merge import MERGE_SEPARATORS
+from batch import RENDER_ENGINES
+from converters import CONVERTERS
+from engine import OUTPUT_FORMATS, JobError, RenderJob, detect_template_keywords
+from metrics import PROFILERS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate documents from a Word template and an Excel/CSV list without the GUI")
+    parser.add_argument('--template', required=True, help="Template file (.docx)")
+    parser.add_argument('--list', required=True, dest='list_path', help="List file (.xlsx or .csv)")
+    parser.add_argument('--config', required=True,
+                        help="JSON file with the keyword mapping and keyword formats")
+    parser.add_argument('--output-dir', required=True, help="Save location")
+    parser.add_argument('--output-formats', nargs='+', choices=OUTPUT_FORMATS,
+                        default=list(OUTPUT_FORMATS), help="Output format(s)")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes for rendering")
+    parser.add_argument('--converter', choices=list(CONVERTERS), help="PDF converter backend")
+    parser.add_argument('--render-engine', choices=RENDER_ENGINES, default='docx',
+                        help="docx edits the document model, splice joins pre-split document.xml bytes")
+    parser.add_argument('--no-dedupe', dest='dedupe', action='store_false',
+                        help="Render every row even when its mapped values repeat an earlier row")
+    parser.add_argument('--prometheus-file',
+                        help="Also write the run metrics to this Prometheus textfile (.prom)")
+    parser.add_argument('--profile', choices=PROFILERS,
+                        help="Profile the run and save the result in the output directory")
+    parser.add_argument('--archive', choices=ARCHIVE_MODES,
+                        help="Write the outputs into one ZIP file, or one per folder, instead of loose files")
+    parser.add_argument('--merge', choices=MERGE_SEPARATORS,
+                        help="Append every row to one document, separated by page or section breaks")
+    parser.add_argument('--volume-size', type=int, default=0,
+                        help="With --merge, start a new document every N rows (0: a single document)")
+    run_mode = parser.add_mutually_exclusive_group()
+    run_mode.add_argument('--resume', dest='run_mode', action='store_const', const='resume',
+                          help="Skip rows whose outputs exist and match the job manifest")
+    run_mode.add_argument('--retry-failed', dest='run_mode', action='store_const',
+                          const='retry_failed', help="Only render rows that failed in the last run")
+    parser.set_defaults(run_mode='all')
+    return parser.parse_args(argv)
+
+
+def load_config(config_path):
+    """Read the mapping and keyword formats from the job config file"""
+    with open(config_path, encoding='utf-8') as config_file:
+        config = json.load(config_file)
+    mapping = config.get('mapping')
+    if not mapping:
+        raise JobError("The config file has no keyword mapping")
+    return mapping, config.get('keyword_formats', {})
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    try:
+        mapping, keyword_formats = load_config(args.config)
+        keywords, keyword_symbols = detect_template_keywords(args.template)
+
+        job = RenderJob(
+            args.template,
+            args.list_path,
+            mapping,
+            keyword_symbols,
+            args.output_dir,
+            formats=args.output_formats,
+            keyword_formats=keyword_formats,
+            workers=args.workers,
+            converter=args.converter,
+            render_engine=args.render_engine,
+            run_mode=args.run_mode,
+            dedupe=args.dedupe,
+            prometheus_path=args.prometheus_file,
+            profile=args.profile,
+            archive=args.archive,
+            merge=args.merge,
+            volume_size=args.volume_size,
+        )
+        summary = job.run()
+    except Exception as e:
+        json.dump({'status': 'error', 'error': str(e)}, sys.stdout, indent=2)
+        print()
+        return 2
+
+    summary['status'] = 'failed' if summary['failed'] else 'ok'
+    summary['failed'] = [{'name': name, 'error': error} for name, error in summary['failed']]
+    summary['unknown_keywords'] = [keyword for keyword in mapping if keyword not in keywords]
+    json.dump(summary, sys.stdout, indent=2)
+    print()
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# Files passed to a single soffice invocation, keeps the command line short
+LIBREOFFICE_BATCH_SIZE = 200
+
+
+class PdfConverter:
+    """Base class for PDF converter backends"""
+    name = None
+    label = None
+
+    def convert_batch(self, docx_paths, output_dir):
+        """
+        Convert many .docx files into PDFs inside output_dir in as few calls as possible.
+        Returns a dict of {docx_path: error message} for the files that failed.
+        """
+        raise NotImplementedError
+
+    def missing_outputs(self, docx_paths, output_dir, error="No PDF was produced"):
+        """Report every file whose PDF does not exist after conversion"""
+        failures = {}
+        for docx_path in docx_paths:
+            if not (Path(output_dir) / f"{Path(docx_path).stem}.pdf").exists():
+                failures[docx_path] = error
+        return failures
+
+
+class Docx2PdfConverter(PdfConverter):
+    """Microsoft Word through docx2pdf, a whole folder is converted by one Word instance"""
+    name = "docx2pdf"
+    label = "Microsoft Word (docx2pdf)"
+
+    def convert_batch(self, docx_paths, output_dir):
+        from docx2pdf import convert
+
+        folders = {Path(docx_path).parent for docx_path in docx_paths}
+        if folders == {Path(output_dir)}:
+            # Convert the folder at once instead of starting Word per file
+            convert(str(output_dir), str(output_dir))
+        else:
+            for docx_path in docx_paths:
+                convert(str(docx_path), str(
+                    Path(output_dir) / f"{Path(docx_path).stem}.pdf"))
+        return self.missing_outputs(docx_paths, output_dir)
+
+
+class LibreOfficeConverter(PdfConverter):
+    """Headless LibreOffice, converts many files per soffice invocation"""
+    name = "libreoffice"
+    label = "LibreOffice (headless)"
+
+    def find_soffice(self):
+        """Locate the soffice executable"""
+        for candidate in ('soffice', 'libreoffice'):
+            path = shutil.which(candidate)
+            if path:
+                return path
+        for path in (r"C:\Program Files\LibreOffice\program\soffice.exe",
+                     "/Applications/LibreOffice.app/Contents/MacOS/soffice"):
+            if Path(path).exists():
+                return path
+        raise RuntimeError("LibreOffice (soffice) was not found on this system")
+
+    def convert_batch(self, docx_paths, output_dir):
+        soffice = self.find_soffice()
+        failures = {}
+
+        # A private profile lets conversions run next to an open LibreOffice window
+        with tempfile.TemporaryDirectory() as profile_dir:
+            profile_url = Path(profile_dir).as_uri()
+            for start in range(0, len(docx_paths), LIBREOFFICE_BATCH_SIZE):
+                batch = docx_paths[start:start + LIBREOFFICE_BATCH_SIZE]
+                result = subprocess.run(
+                    [soffice, f"-env:UserInstallation={profile_url}", "--headless",
+                     "--convert-to", "pdf", "--outdir", str(output_dir)]
+                    + [str(docx_path) for docx_path in batch],
+                    capture_output=True, text=True)
+                error = "No PDF was produced"
+                if result.returncode != 0:
+                    error = f"soffice exited with code {result.returncode}: {result.stderr.strip()}"
+                failures.update(self.missing_outputs(batch, output_dir, error))
+
+        return failures
+
+
+CONVERTERS = {
+    converter.name: converter
+    for converter in (Docx2PdfConverter, LibreOfficeConverter)
+}
+
+
+def default_converter_name():
+    """docx2pdf needs Microsoft Word, which only exists on Windows and macOS"""
+    if sys.platform in ('win32', 'darwin'):
+        return Docx2PdfConverter.name
+    return LibreOfficeConverter.name
+
+
+def get_converter(name=None):
+    """Create the converter backend with the given name"""
+    name = name or default_converter_name()
+    if name not in CONVERTERS:
+        raise ValueError(
+            f"Unknown PDF converter '{name}', choose from: {', '.join(CONVERTERS)}")
+    return CONVERTERS[name]()
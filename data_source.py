@@ -0,0 +1,200 @@
+import os
+import pandas as pd
+from openpyxl import load_workbook
+
+# Rows parsed at a time when streaming a CSV file
+CSV_CHUNK_SIZE = 10000
+
+# Data sources of list files already opened, keyed by (path, mtime, size)
+_source_cache = {}
+
+
+class DataSource:
+    """
+    Rows of an Excel or CSV list file, read lazily so memory stays flat
+    regardless of the number of rows. CSV files are parsed in chunks with
+    pandas, .xlsx files are streamed with openpyxl in read-only mode, and
+    only the columns a job needs are read.
+    """
+
+    def __init__(self, path, chunk_size=CSV_CHUNK_SIZE):
+        self.path = str(path)
+        self.chunk_size = chunk_size
+        self.is_excel = self.path.endswith('.xlsx')
+        self._columns = None
+        self._row_count = None
+
+    @property
+    def columns(self):
+        """Column names from the header row"""
+        if self._columns is None:
+            if self.is_excel:
+                workbook = load_workbook(self.path, read_only=True, data_only=True)
+                try:
+                    header = next(workbook.worksheets[0].iter_rows(values_only=True), ())
+                finally:
+                    workbook.close()
+                self._columns = self._header_names(header)
+            else:
+                self._columns = list(pd.read_csv(self.path, nrows=0).columns)
+        return self._columns
+
+    def _header_names(self, header):
+        """Name blank header cells the same way pandas does"""
+        return [column if column is not None else f"Unnamed: {i}"
+                for i, column in enumerate(header)]
+
+    def count_rows(self):
+        """
+        Count data rows without parsing them. For CSV files this counts line
+        breaks, so quoted values spanning several lines make it an estimate.
+        """
+        if self._row_count is None:
+            self._row_count = self._count_rows()
+        return self._row_count
+
+    def _count_rows(self):
+        if self.is_excel:
+            workbook = load_workbook(self.path, read_only=True, data_only=True)
+            try:
+                worksheet = workbook.worksheets[0]
+                if worksheet.max_row is not None:
+                    return max(worksheet.max_row - 1, 0)
+                # No dimension stored in the sheet, fall back to walking the rows
+                return max(sum(1 for _ in worksheet.iter_rows(values_only=True)) - 1, 0)
+            finally:
+                workbook.close()
+
+        lines = 0
+        last_byte = b'\n'
+        with open(self.path, 'rb') as data_file:
+            for block in iter(lambda: data_file.read(1 << 20), b''):
+                lines += block.count(b'\n')
+                last_byte = block[-1:]
+        if last_byte != b'\n':
+            lines += 1  # Last line without a line break
+        return max(lines - 1, 0)
+
+    def row_offsets(self, starts):
+        """
+        Byte offsets of the CSV lines holding the data rows numbered in starts
+        (ascending), so a range of rows can be read without parsing the rows
+        before it. An offset is None when it cannot be found from the lines
+        alone: for rows after a quoted value spanning several lines, rows past
+        the end of the file, and every row of an Excel file.
+        """
+        offsets = []
+        if not self.is_excel:
+            targets = iter(starts)
+            target = next(targets, None)
+            row = -1  # Data row of the next non-blank line, the header comes first
+            offset = 0
+            with open(self.path, 'rb') as data_file:
+                for line in data_file:
+                    if target is None or line.count(b'"') % 2:
+                        break
+                    # pandas skips blank lines, they hold no row
+                    if line.strip():
+                        if row == target:
+                            offsets.append(offset)
+                            target = next(targets, None)
+                        row += 1
+                    offset += len(line)
+        return offsets + [None] * (len(starts) - len(offsets))
+
+    def iter_chunks(self, columns=None, start=0, stop=None, offset=None):
+        """
+        Yield DataFrames of at most chunk_size rows holding the requested
+        columns, for the data rows from start up to stop (all rows by default).
+        offset is the byte offset of row start from row_offsets, CSV files
+        are then read from there instead of from the top.
+        """
+        columns = columns or self.columns
+        if self.is_excel:
+            yield from self._iter_excel_chunks(columns, start, stop)
+        else:
+            yield from self._iter_csv_chunks(columns, start, stop, offset)
+
+    def _iter_csv_chunks(self, columns, start, stop, offset):
+        # Only the requested columns are parsed, and kept as the text in the
+        # file so values like ZIP codes keep their leading zeros. Without an
+        # offset the rows before start are parsed and dropped, skipping lines
+        # would miscount quoted values spanning several lines
+        with open(self.path, 'rb') as data_file:
+            if offset is None:
+                position = 0
+                chunks = pd.read_csv(data_file, chunksize=self.chunk_size, usecols=columns, dtype=str)
+            else:
+                position = start
+                data_file.seek(offset)
+                chunks = pd.read_csv(data_file, chunksize=self.chunk_size, header=None,
+                                     names=self.columns, usecols=columns, dtype=str)
+            for chunk in chunks:
+                chunk_start = position
+                position += len(chunk)
+                if position <= start:
+                    continue
+                if stop is not None and chunk_start >= stop:
+                    return
+                chunk = chunk[columns]
+                if chunk_start < start or (stop is not None and position > stop):
+                    chunk = chunk.iloc[max(start - chunk_start, 0):None if stop is None else stop - chunk_start]
+                yield chunk
+
+    def _iter_excel_chunks(self, columns, start, stop):
+        # The sheet XML is streamed from the top even with min_row, so a range
+        # late in the sheet still costs a read of the rows before it
+        workbook = load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            worksheet = workbook.worksheets[0]
+            header = self._header_names(next(worksheet.iter_rows(max_row=1, values_only=True), ()))
+            positions = [header.index(column) for column in columns]
+            # Cells right of the last requested column are never read. Excel
+            # cells keep their types, text cells already hold their leading zeros.
+            # Data row i is sheet row i + 2, empty rows included
+            rows = worksheet.iter_rows(
+                min_row=2 + start, max_col=max(positions, default=0) + 1, values_only=True)
+            chunk = []
+            empty_rows = 0
+            index = start  # Data row index of the current sheet row
+            for values in rows:
+                # Empty rows only count once a filled row follows, trailing
+                # empty rows are dropped like pandas does
+                if all(value is None for value in values):
+                    if stop is None or index < stop:
+                        empty_rows += 1
+                    index += 1
+                    continue
+                chunk.extend([[None] * len(columns)] * empty_rows)
+                empty_rows = 0
+                if stop is not None and index >= stop:
+                    break
+                index += 1
+
+                chunk.append([values[position] if position < len(values) else None
+                              for position in positions])
+                if len(chunk) >= self.chunk_size:
+                    yield pd.DataFrame(chunk, columns=columns)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame(chunk, columns=columns)
+        finally:
+            workbook.close()
+
+
+def open_data_source(path):
+    """
+    Return the DataSource of a list file, shared by every step of the
+    application so the header and row count are read at most once for as
+    long as the file does not change.
+    """
+    path = os.path.abspath(str(path))
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    source = _source_cache.get(key)
+    if source is None:
+        # Earlier versions of the same file are out of date
+        for cached_key in [cached_key for cached_key in _source_cache if cached_key[0] == path]:
+            del _source_cache[cached_key]
+        source = _source_cache[key] = DataSource(path)
+    return source
@@ -0,0 +1,566 @@
+import re
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from docx import Document
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+from archive import ARCHIVE_MODES, ArchiveWriter
+from batch import convert_pdfs, output_paths, render_rows
+from converters import get_converter
+from data_source import open_data_source
+from merge import DOCUMENT_PART, MERGE_SEPARATORS, MergedDocument
+from manifest import RUN_MODES, JobManifest, file_hash, job_hash, row_hash, should_skip
+from metrics import PROFILERS, REPORT_NAME, RunMetrics, profiled
+from prepare import prepare_rows
+from render import CompiledTemplate, story_parts
+from render_cache import RenderCache
+
+OUTPUT_FORMATS = ('pdf', 'docx')
+
+
+class JobError(Exception):
+    """Raised when a job cannot start because of its input files or settings"""
+
+
+# Symbol pairs a keyword can be wrapped in, in the order they are reported.
+# An end symbol of None means the keyword runs up to the next whitespace.
+KEYWORD_SYMBOLS = [
+    # Double symbol with closing pair
+    ('$$', '$$'), ('##', '##'), ('@@', '@@'), ('||', '||'),
+    # Single symbol with closing pair
+    ('$', '$'), ('#', '#'), ('@', '@'), ('|', '|'),
+    # Double symbol without closing
+    ('$$', None), ('||', None), ('@@', None),
+    # Single symbol without closing
+    ('$', None), ('|', None), ('@', None),
+    # Double brackets
+    ('{{', '}}'), ('[[', ']]'), ('((', '))'),
+    # Single brackets
+    ('{', '}'), ('[', ']'), ('(', ')'),
+    # Mixed formats - brackets with symbols
+    ('{$', '$}'), ('{#', '#}'), ('[#', '#]'), ('[$', '$]'), ('(#', '#)'), ('($', '$)'),
+    # Double symbols with brackets
+    ('{$$', '$$}'), ('[##', '##]'), ('(##', '##)'),
+]
+
+# Symbol pairs grouped by the first character of their start symbol
+_SYMBOLS_BY_CHAR = {}
+for _order, (_start_symbol, _end_symbol) in enumerate(KEYWORD_SYMBOLS):
+    _SYMBOLS_BY_CHAR.setdefault(_start_symbol[0], []).append(
+        (_order, _start_symbol, _end_symbol))
+
+# Any character that can start a keyword
+_START_CHARS = re.compile('[' + re.escape(''.join(_SYMBOLS_BY_CHAR)) + ']')
+# A keyword needs a digit right after a symbol (spaces allowed), lines
+# without one are skipped. Non-ASCII word characters count as digits too
+# because str.isdigit also accepts superscripts and the like.
+_KEYWORD_HINT = re.compile(r'[$#@|{\[(][^\S\n]*[^\W_a-zA-Z]')
+_WHITESPACE = re.compile(r'\s')
+EMAIL_PATTERN = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
+# Keywords found in each template, keyed by the hash of its content
+_template_keywords = {}
+
+
+def _keyword_end(line, content_start, end_symbol):
+    """
+    Find the shortest keyword starting at content_start, the way a lazy (.+?)
+    would. Returns (content_end, match_end) or None when there is no match.
+    """
+    if content_start >= len(line):
+        return None
+
+    if end_symbol:
+        content_end = line.find(end_symbol, content_start + 1)
+        if content_end == -1:
+            return None
+        return content_end, content_end + len(end_symbol)
+
+    # Without closing symbol the keyword ends at whitespace or the end of line
+    whitespace = _WHITESPACE.search(line, content_start + 1)
+    if whitespace:
+        return whitespace.start(), whitespace.end()
+    return len(line), len(line)
+
+
+def _scan_line(line, is_valid_keyword, hits):
+    """
+    Add the keywords of one line to hits, a list of keywords per symbol pair.
+    Keywords never span lines, so every line can be scanned on its own.
+    """
+    # Every symbol pair scans independently, a match only hides later matches
+    # of the same pair, so each pair keeps the position where it may match next
+    next_start = [0] * len(KEYWORD_SYMBOLS)
+
+    for start_char in _START_CHARS.finditer(line):
+        position = start_char.start()
+        for order, start_symbol, end_symbol in _SYMBOLS_BY_CHAR[start_char.group()]:
+            if position < next_start[order] or not line.startswith(start_symbol, position):
+                continue
+            end = _keyword_end(line, position + len(start_symbol), end_symbol)
+            if end is None:
+                continue
+            content_end, match_end = end
+            next_start[order] = match_end
+
+            keyword = line[position + len(start_symbol):content_end].strip()
+            if is_valid_keyword(keyword, line[position:match_end].strip()):
+                hits[order].append(keyword)
+
+
+def _email_digit_strings(email_addresses):
+    """Every digit sequence contained in one of the email addresses"""
+    digit_strings = set()
+    for email in email_addresses:
+        for digits in re.findall(r'[0-9]+', email):
+            for i in range(len(digits)):
+                for j in range(i + 1, len(digits) + 1):
+                    digit_strings.add(digits[i:j])
+    return digit_strings
+
+
+def detect_keywords(text):
+    """
+    Detect keywords from text with various formats in a single scan.
+    Returns the unique keywords and the symbols found around each keyword.
+    Rules:
+    - Ignore email addresses
+    - Only detect digits when wrapped in symbols
+    - Brackets must have both opening and closing symbols
+    """
+    # Email addresses for filtering
+    email_addresses = set(EMAIL_PATTERN.findall(text))
+    email_digits = _email_digit_strings(email_addresses)
+
+    def is_valid_keyword(keyword, raw_match):
+        """
+        Validate if keyword meets the criteria:
+        - Not part of an email address
+        - Contains only digits when wrapped in symbols
+        """
+        return (keyword.isdigit()
+                and keyword not in email_digits
+                and raw_match not in email_addresses)
+
+    hits = [[] for _ in KEYWORD_SYMBOLS]
+    position = 0
+    while True:
+        hint = _KEYWORD_HINT.search(text, position)
+        if not hint:
+            break
+        line_start = text.rfind('\n', 0, hint.start()) + 1
+        line_end = text.find('\n', hint.end())
+        if line_end == -1:
+            line_end = len(text)
+        _scan_line(text[line_start:line_end], is_valid_keyword, hits)
+        position = line_end + 1
+
+    keyword_symbols = {}  # Store original symbols for each keyword
+    for (start_symbol, end_symbol), keywords in zip(KEYWORD_SYMBOLS, hits):
+        for keyword in keywords:
+            keyword_symbols.setdefault(keyword, []).append((start_symbol, end_symbol))
+
+    return list(keyword_symbols), keyword_symbols  # Return unique keywords
+
+
+def template_text(template_path):
+    """
+    Collect the text of a template document in one pass over every paragraph
+    of every story part: body, tables at any depth, text boxes, headers,
+    footers, footnotes and endnotes. One line per paragraph.
+    """
+    all_text = []
+    for _, element in story_parts(Document(template_path)):
+        for p in element.iter(qn('w:p')):
+            text = Paragraph(p, None).text
+            if text.strip():
+                all_text.append(text)
+    return '\n'.join(all_text)
+
+
+def detect_template_keywords(template_path):
+    """
+    Detect keywords from a template document, returns (keywords, keyword_symbols).
+    Results are cached by template content, so reopening a template is instant.
+    """
+    template_digest = file_hash(template_path)
+    if template_digest not in _template_keywords:
+        _template_keywords[template_digest] = detect_keywords(template_text(template_path))
+    keywords, keyword_symbols = _template_keywords[template_digest]
+    # Copies, callers are free to change what they get
+    return list(keywords), {keyword: list(symbols) for keyword, symbols in keyword_symbols.items()}
+
+
+def find_name_column(columns):
+    """Find the name column using case-insensitive comparison"""
+    # Check for various possible name column formats
+    name_variants = ['name', 'names', 'full name',
+                     'fullname', '$$name', 'NAME', '$$NAME']
+    for column in columns:
+        # Convert to lowercase for comparison
+        col_lower = column.lower()
+        # Check if the column contains any of the name variants
+        if any(variant.lower() in col_lower for variant in name_variants):
+            return column
+    return None
+
+
+def find_folder_column(columns):
+    """Find the folder column regardless of case"""
+    folder_variants = ['folder', 'folder_name', 'foldername']
+    for column in columns:
+        if column.lower() in folder_variants:
+            return column
+    return None
+
+
+class RenderJob:
+    """
+    One batch run from a template and a list file, without any GUI.
+    Used by the desktop application and the command line entry point.
+    """
+
+    def __init__(self, template_path, list_path, mapping, keyword_symbols, save_location,
+                 formats=OUTPUT_FORMATS, keyword_formats=None, workers=1, converter=None,
+                 render_engine='docx', run_mode='all', dedupe=True, prometheus_path=None,
+                 profile=None, archive=None, merge=None, volume_size=0, row_range=None,
+                 manifest_path=None, report_path=None, row_offset=None):
+        self.template_path = str(template_path)
+        self.list_path = str(list_path)
+        self.mapping = mapping
+        self.keyword_symbols = keyword_symbols
+        self.save_location = str(save_location)
+        self.formats = [format_type for format_type in OUTPUT_FORMATS if format_type in formats]
+        self.keyword_formats = keyword_formats or {}
+        self.workers = workers
+        self.converter = converter
+        self.render_engine = render_engine
+        self.run_mode = run_mode
+        self.dedupe = dedupe
+        self.prometheus_path = prometheus_path
+        self.profile = profile
+        self.archive = archive
+        self.merge = merge
+        self.volume_size = volume_size
+        # (start, stop) data rows of a shard, stop None for the end of the file
+        self.row_range = tuple(row_range) if row_range else (0, None)
+        self.row_offset = row_offset  # Byte offset of the first row of a CSV shard
+        self.manifest_path = manifest_path
+        self.report_path = report_path
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """
+        Ask a running job to stop, safe to call from another thread. Rows in
+        progress are finished, the rest are left for a resumed run.
+        """
+        self._cancel.set()
+
+    def run(self, progress=None):
+        """
+        Render every row of the list file and return a summary dict.
+        progress is called as progress(stage, done, total) with stage
+        'render' for each row and 'convert' before and during the PDF conversion.
+        Every finished row is recorded in the job manifest of the save
+        location, which the resume and retry_failed run modes read back.
+        With dedupe, rows with the same mapped values are rendered once and
+        linked to every output path.
+        Timings of every stage are written to render_report.json in the save
+        location, and to a Prometheus textfile if prometheus_path is set.
+        With archive ('single' or 'per_folder') the outputs are streamed into
+        ZIP files instead of being saved as loose files.
+        With merge ('page' or 'section') every row is appended to one document,
+        or to volumes of volume_size rows, converted to PDF once per volume.
+        With row_range only the rows from start up to stop are rendered, for
+        the shards of a sharded run, which keep their manifest and report at
+        manifest_path and report_path instead of the save location. A CSV
+        shard with row_offset is read from that byte offset of the file.
+        """
+        if not self.formats:
+            raise JobError("Please select at least one output format")
+        if self.run_mode not in RUN_MODES:
+            raise JobError(f"Unknown run mode: {self.run_mode}")
+        if self.profile and self.profile not in PROFILERS:
+            raise JobError(f"Unknown profiler: {self.profile}")
+        if self.archive and self.archive not in ARCHIVE_MODES:
+            raise JobError(f"Unknown archive mode: {self.archive}")
+        if self.archive and self.run_mode != 'all':
+            raise JobError("Resume and retry need loose output files, they cannot be used with an archive")
+        if self.merge and self.merge not in MERGE_SEPARATORS:
+            raise JobError(f"Unknown merge separator: {self.merge}")
+        if self.merge and self.run_mode != 'all':
+            raise JobError("Resume and retry need one file per row, they cannot be used with merged output")
+        if self.merge and self.archive:
+            raise JobError("Merged output cannot be written into an archive")
+        if self.volume_size < 0:
+            raise JobError("The volume size cannot be negative")
+
+        metrics = RunMetrics()
+        profile_path = Path(self.save_location) / (
+            'render_profile.prof' if self.profile == 'cprofile' else 'render_profile.html')
+        if self.profile:
+            profile_path.parent.mkdir(parents=True, exist_ok=True)
+        with profiled(self.profile, profile_path):
+            summary = self._run(progress, metrics)
+
+        report = metrics.report()
+        report['summary'] = {key: len(value) if key == 'failed' else value
+                             for key, value in summary.items() if key != 'formats'}
+        report_path = Path(self.report_path or Path(self.save_location) / REPORT_NAME)
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        metrics.write_json(report_path, report)
+        if self.prometheus_path:
+            metrics.write_prometheus(self.prometheus_path, report)
+
+        summary['report'] = str(report_path)
+        summary['timings'] = {stage: data['total_seconds'] for stage, data in report['stages'].items()}
+        if self.profile:
+            summary['profile'] = str(profile_path)
+        return summary
+
+    def _run(self, progress, metrics):
+        """Run the job, gathering timings and counters in metrics"""
+
+        # Rows are streamed from the list file instead of loading it whole,
+        # the header and row count are shared with the GUI's column detection
+        source = open_data_source(self.list_path)
+        list_columns = source.columns
+
+        # Find name and folder columns
+        name_column = find_name_column(list_columns)
+        folder_column = find_folder_column(list_columns)
+
+        if not name_column:
+            raise JobError(
+                "Name column not found in list file. Please ensure you have a column with 'name' in it (case insensitive).")
+
+        missing_columns = [column for column in self.mapping.values() if column not in list_columns]
+        if missing_columns:
+            raise JobError(
+                f"Columns not found in list file: {', '.join(missing_columns)}")
+
+        # A merged volume keeps the headers, footers and notes of its first row,
+        # placeholders there would show the first row's values on every page
+        if self.merge:
+            with metrics.time('compile'):
+                template = CompiledTemplate(self.template_path, self.mapping, self.keyword_symbols)
+            other_parts = [partname for partname, _ in template.stories if partname != DOCUMENT_PART]
+            if other_parts:
+                raise JobError(
+                    "Merged output only supports keywords in the document body, the template has "
+                    f"mapped keywords in: {', '.join(other_parts)}")
+
+        # In archive mode only the .docx files waiting for PDF conversion touch
+        # the disk, in a staging folder removed at the end of the run. They are
+        # converted once every row has rendered, like loose PDFs, then added
+        archive = ArchiveWriter(self.save_location, self.archive) if self.archive else None
+        render_location = self.save_location
+        if archive is not None:
+            Path(self.save_location).mkdir(parents=True, exist_ok=True)
+            render_location = tempfile.mkdtemp(prefix='.staging_', dir=self.save_location)
+
+        # Merged rows are only rendered to .docx in memory, the volumes are
+        # written and converted once they are complete
+        merged = None
+        if self.merge:
+            merged = MergedDocument(self.save_location, self.formats, self.merge, self.volume_size)
+
+        # Settings shared by every row, serial or in worker processes
+        job = {
+            'save_location': render_location,
+            'formats': ['docx'] if merged is not None else self.formats,
+            'in_memory': archive is not None or merged is not None,
+        }
+
+        # Only the mapped, name and folder columns are needed for rendering
+        columns = list(dict.fromkeys(
+            list(self.mapping.values()) + [name_column] + ([folder_column] if folder_column else [])))
+
+        manifest = JobManifest(self.save_location, self.manifest_path)
+        previous = manifest.load() if self.run_mode != 'all' else {}
+        template_digest = file_hash(self.template_path)
+        job_digest = job_hash(template_digest, self.mapping, self.formats, self.keyword_formats)
+
+        # Hash and output paths of every row handed to the renderer, until it is recorded
+        in_flight = {}
+        skipped_files = 0
+        # Archive members cannot be linked and merged documents need every row, so both render all rows
+        cache = None
+        if self.dedupe and archive is None and merged is None:
+            cache = RenderCache(job_digest, lambda folder_name, output_name: output_paths(
+                self.save_location, folder_name, output_name, self.formats))
+        row_folders = {}  # Index -> folder name of archive rows not fully written yet
+
+        first_row, last_row = self.row_range
+
+        def rows_to_render():
+            nonlocal skipped_files
+            # Values are converted to text column by column before rendering
+            chunks = source.iter_chunks(columns, first_row, last_row, self.row_offset)
+            rows = prepare_rows(chunks, self.mapping, name_column, folder_column, start=first_row)
+            while not self._cancel.is_set():
+                with metrics.time('load'):
+                    row = next(rows, None)
+                if row is None:
+                    return
+                index, output_name, folder_name, values = row
+                row_digest = row_hash(output_name, folder_name, values)
+                if archive is not None:
+                    outputs = archive.output_paths(folder_name, output_name, self.formats)
+                    row_folders[index] = folder_name
+                else:
+                    outputs = output_paths(self.save_location, folder_name, output_name, self.formats)
+                if should_skip(previous.get(index), row_digest, job_digest, outputs, self.run_mode):
+                    skipped_files += 1
+                    continue
+                if cache is not None and cache.lookup(index, values, output_name, folder_name, row_digest):
+                    continue
+                in_flight[index] = (row_digest, outputs)
+                yield row
+
+        results = render_rows(
+            rows_to_render(), self.template_path, self.mapping, self.keyword_symbols,
+            self.keyword_formats, job, workers=self.workers, render_engine=self.render_engine,
+            metrics=metrics)
+
+        # Counted up front for progress reporting only
+        expected_files = (last_row if last_row is not None else source.count_rows()) - first_row
+        total_files = 0
+        successful_files = 0
+        failed_files = []
+        pending_paths = {}  # Index -> .docx waiting for PDF conversion
+        pending_names = {}
+        failed_rows = {}  # Index -> error, duplicates of these rows fail too
+
+        manifest.open(
+            job_digest, template=self.template_path, template_hash=template_digest,
+            formats=self.formats, list=self.list_path, run_mode=self.run_mode)
+        try:
+            for index, output_name, error, pending_pdf, docx_data in results:
+                if docx_data is not None and merged is not None:
+                    try:
+                        with metrics.time('merge'):
+                            in_flight[index] = (in_flight[index][0], merged.output_paths())
+                            merged.add(docx_data)
+                    except Exception as merge_error:
+                        error = f"Merge error: {str(merge_error)}"
+                elif docx_data is not None:
+                    with metrics.time('archive'):
+                        archive.add_bytes(row_folders[index], 'docx', output_name, docx_data)
+                if archive is not None and (error or not pending_pdf):
+                    # Nothing more of this row goes into the archive
+                    row_folders.pop(index, None)
+                if error:
+                    failed_files.append((output_name, error))
+                    failed_rows[index] = error
+                    manifest.record(index, output_name, *in_flight.pop(index), error=error)
+                elif pending_pdf:
+                    # Recorded once the PDF conversion is done
+                    pending_paths[index] = pending_pdf
+                    pending_names[index] = output_name
+                else:
+                    successful_files += 1
+                    manifest.record(index, output_name, *in_flight.pop(index))
+
+                total_files += 1
+                if progress:
+                    done = index + 1 - first_row
+                    progress('render', done, max(expected_files, done))
+
+            # Convert all PDFs with one converter call per output folder
+            if pending_paths and not self._cancel.is_set():
+                if progress:
+                    progress('convert', 0, len(pending_paths))
+                converter = get_converter(self.converter)
+                converted_files = 0
+                pdf_folder = None
+                for index, error in convert_pdfs(pending_paths.items(), converter, metrics):
+                    # Folders are converted lazily, a cancel skips the folders not started yet
+                    if Path(pending_paths[index]).parent != pdf_folder:
+                        if self._cancel.is_set():
+                            break
+                        pdf_folder = Path(pending_paths[index]).parent
+
+                    output_name = pending_names[index]
+                    folder_name = row_folders.pop(index, None)
+                    if error:
+                        error = f"PDF conversion error: {error}"
+                    elif archive is not None:
+                        pdf_path = Path(pending_paths[index]).with_suffix('.pdf')
+                        try:
+                            with metrics.time('archive'):
+                                archive.add_file(folder_name, 'pdf', output_name, pdf_path)
+                            pdf_path.unlink()
+                        except OSError as archive_error:
+                            error = f"Archive error: {archive_error}"
+                    if error:
+                        failed_files.append((output_name, error))
+                        failed_rows[index] = error
+                    else:
+                        successful_files += 1
+                    manifest.record(index, output_name, *in_flight.pop(index), error=error)
+
+                    converted_files += 1
+                    if progress:
+                        progress('convert', converted_files, len(pending_paths))
+
+            # Merged volumes, converted with one converter call each
+            if merged is not None:
+                with metrics.time('merge'):
+                    merged.close()
+                if merged.pending_pdfs and not self._cancel.is_set():
+                    if progress:
+                        progress('convert', 0, len(merged.pending_pdfs))
+                    converter = get_converter(self.converter)
+                    pending_volumes = [(pending_pdf, pending_pdf) for pending_pdf in merged.pending_pdfs]
+                    for converted_files, (pending_pdf, error) in enumerate(
+                            convert_pdfs(pending_volumes, converter, metrics), 1):
+                        if error:
+                            failed_files.append((Path(pending_pdf).stem, f"PDF conversion error: {error}"))
+                        if progress:
+                            progress('convert', converted_files, len(merged.pending_pdfs))
+                elif merged.pending_pdfs:
+                    for pending_pdf in merged.pending_pdfs:
+                        Path(pending_pdf).unlink(missing_ok=True)
+
+            # Rows identical to an earlier row get a link to its outputs
+            if cache is not None and not self._cancel.is_set():
+                source_outputs = manifest.run_outputs(cache.source_indices())
+                duplicates = cache.copy_duplicates(failed_rows, source_outputs)
+                for index, output_name, row_digest, outputs, error in duplicates:
+                    if error:
+                        failed_files.append((output_name, error))
+                    else:
+                        successful_files += 1
+                    total_files += 1
+                    metrics.count('linked_rows')
+                    manifest.record(index, output_name, row_digest, outputs, error=error)
+
+            # Temporary .docx files of PDFs that were never converted
+            for index, pending_pdf in pending_paths.items():
+                if index in in_flight:
+                    Path(pending_pdf).unlink(missing_ok=True)
+        finally:
+            manifest.close()
+            if archive is not None:
+                archive.close()
+                shutil.rmtree(render_location, ignore_errors=True)
+
+        return {
+            'total': total_files,
+            'successful': successful_files,
+            'failed': failed_files,
+            'skipped': skipped_files,
+            'cache_hits': cache.hits if cache is not None else 0,
+            'cache_misses': cache.misses if cache is not None else 0,
+            'save_location': self.save_location,
+            'formats': self.formats,
+            'manifest': str(manifest.path),
+            'cancelled': self._cancel.is_set(),
+            'archives': [str(path) for path in archive.archives] if archive is not None else [],
+            'volumes': merged.written if merged is not None else [],
+            # The engine that rendered the rows, docx when splice fell back
+            'render_engine': 'docx' if metrics.counters.get('engine_fallbacks') else self.render_engine,
+        }
@@ -1,12 +1,35 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, colorchooser
 import os
-from docx import Document
-from docx.shared import Pt, RGBColor
-from docx2pdf import convert
-import pandas as pd
-import re
-from pathlib import Path
+import queue
+import threading
+import time
+from itertools import islice
+from archive import ARCHIVE_MODES
+from batch import RENDER_ENGINES
+from merge import MERGE_SEPARATORS
+from converters import CONVERTERS, default_converter_name
+from data_source import open_data_source
+from matching import CONFIDENT_MATCH_TYPES, MATCH_LABELS, ColumnMatcher, classify_match
+from engine import JobError, RenderJob, detect_template_keywords
+
+# How often the progress window is refreshed while a job runs
+PROGRESS_INTERVAL_MS = 100
+
+# Columns of the keyword table: (id, heading, width)
+KEYWORD_COLUMNS = (
+    ("selected", "Select", 60),
+    ("keyword", "Keyword", 150),
+    ("symbols", "Format(s)", 110),
+    ("status", "Status", 170),
+    ("match", "Match", 220),
+    ("format", "Format", 150),
+)
+CHECKED = "☑"
+UNCHECKED = "☐"
+
+# Unmatched keywords listed in the summary before it is cut short
+SUMMARY_KEYWORD_LIMIT = 5
 
 
 class KeywordFormatDialog:
@@ -165,11 +188,20 @@ class DocumentAutomation:
         self.template_path = tk.StringVar()
         self.list_path = tk.StringVar()
         self.save_location = tk.StringVar()
-        self.keywords = []
         self.template_keywords = []
         self.list_columns = []
-        self.keyword_checkboxes = {}  # Store checkboxes for keywords
+        # Keyword -> {'selected', 'column', 'match_type'}, one entry per table row
+        self.keyword_state = {}
+        self.selected_count = 0
+        self.unmatched_selected = {}  # Selected keywords without a column, in selection order
         self.keyword_formats = {}     # Store format settings for keywords
+        self.worker_count = tk.IntVar(value=1)  # Worker processes for rendering
+        self.pdf_converter = tk.StringVar(value=default_converter_name())
+        self.render_engine = tk.StringVar(value="docx")
+        self.run_mode = tk.StringVar(value="all")  # all, resume or retry_failed
+        self.archive_mode = tk.StringVar(value="none")  # none, single or per_folder
+        self.merge_mode = tk.StringVar(value="none")  # none, page or section
+        self.volume_size = tk.IntVar(value=0)  # Rows per merged document, 0 for one document
 
         # Output format checkboxes
         self.output_formats = {
@@ -185,107 +217,6 @@ class DocumentAutomation:
         # Start with upload frame
         self.show_upload_frame()
 
-    def detect_keywords(self, text):
-        """
-        Detect keywords from text with various formats.
-        Rules:
-        - Ignore email addresses
-        - Only detect digits when wrapped in symbols
-        - Brackets must have both opening and closing symbols
-        """
-        patterns = [
-            # Double symbol with closing pair
-            (r'\$\$(.+?)\$\$', '$$', '$$'),       # $$keyword$$ 
-            (r'##(.+?)##', '##', '##'),           # ##keyword##
-            (r'@@(.+?)@@', '@@', '@@'),           # @@keyword@@
-            (r'\|\|(.+?)\|\|', '||', '||'),       # ||keyword||
-            
-            # Single symbol with closing pair
-            (r'\$(.+?)\$', '$', '$'),             # $keyword$
-            (r'#(.+?)#', '#', '#'),               # #keyword#
-            (r'@(.+?)@', '@', '@'),               # @keyword@
-            (r'\|(.+?)\|', '|', '|'),             # |keyword|
-            
-            # Double symbol without closing
-            (r'\$\$(.+?)(?:\s|$)', '$$', None),   # $$keyword
-            (r'\|\|(.+?)(?:\s|$)', '||', None),   # ||keyword
-            (r'@@(.+?)(?:\s|$)', '@@', None),     # @@keyword
-            
-            # Single symbol without closing
-            (r'\$(.+?)(?:\s|$)', '$', None),      # $keyword
-            (r'\|(.+?)(?:\s|$)', '|', None),      # |keyword
-            (r'@(.+?)(?:\s|$)', '@', None),       # @keyword
-            
-            # Double brackets
-            (r'\{\{(.+?)\}\}', '{{', '}}'),       # {{keyword}}
-            (r'\[\[(.+?)\]\]', '[[', ']]'),       # [[keyword]]
-            (r'\(\((.+?)\)\)', '((', '))'),       # ((keyword))
-            
-            # Single brackets
-            (r'\{(.+?)\}', '{', '}'),             # {keyword}
-            (r'\[(.+?)\]', '[', ']'),             # [keyword]
-            (r'\((.+?)\)', '(', ')'),             # (keyword)
-            
-            # Mixed formats - brackets with symbols
-            (r'\{\$(.+?)\$\}', '{$', '$}'),       # {$keyword$}
-            (r'\{#(.+?)#\}', '{#', '#}'),         # {#keyword#}
-            (r'\[#(.+?)#\]', '[#', '#]'),         # [#keyword#]
-            (r'\[\$(.+?)\$\]', '[$', '$]'),       # [$keyword$]
-            (r'\(#(.+?)#\)', '(#', '#)'),         # (#keyword#)
-            (r'\(\$(.+?)\$\)', '($', '$)'),       # ($keyword$)
-            
-            # Double symbols with brackets
-            (r'\{\$\$(.+?)\$\$\}', '{$$', '$$}'), # {$$keyword$$}
-            (r'\[##(.+?)##\]', '[##', '##]'),     # [##keyword##]
-            (r'\(##(.+?)##\)', '(##', '##)'),     # (##keyword##)
-        ]
-
-        # Email pattern for filtering
-        email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-        email_addresses = set(re.findall(email_pattern, text))
-
-        keywords = []
-        self.keyword_symbols = {}  # Store original symbols for each keyword
-
-        def is_valid_keyword(keyword, raw_match):
-            """
-            Validate if keyword meets the criteria:
-            - Not part of an email address
-            - Contains only digits when wrapped in symbols
-            """
-            # Remove extra whitespace
-            keyword = keyword.strip()
-            if not keyword:
-                return False
-                
-            # Check if the keyword is part of an email address
-            if any(keyword in email for email in email_addresses):
-                return False
-                
-            # Check if the raw match (including symbols) is an email address
-            if raw_match in email_addresses:
-                return False
-                
-            # Only accept digits
-            return keyword.isdigit()
-
-        for pattern, start_symbol, end_symbol in patterns:
-            matches = re.finditer(pattern, text)
-            for match in matches:
-                # Get the keyword inside the symbols
-                keyword = match.group(1).strip()
-                raw_match = match.group(0).strip()
-                
-                # Only add keyword if it meets the validation criteria
-                if is_valid_keyword(keyword, raw_match):
-                    if keyword not in self.keyword_symbols:
-                        self.keyword_symbols[keyword] = []
-                    # Only store if it's a complete bracket pair or a special symbol
-                    if (start_symbol and end_symbol) or start_symbol in ['$$', '||', '@@', '$', '|', '@']:
-                        self.keyword_symbols[keyword].append((start_symbol, end_symbol))
-
-        return list(set(self.keyword_symbols.keys()))  # Return unique keywords
-
     def create_upload_frame(self):
         """Create the first frame for file upload"""
         frame = ttk.Frame(self.root)
@@ -340,32 +271,51 @@ class DocumentAutomation:
                         font=("Helvetica", 14, "bold"))
         title.pack(pady=20)
 
-        # Results section with scrollbar
+        # Select all toolbar
+        toolbar = ttk.Frame(frame)
+        toolbar.pack(fill="x", padx=20)
+        self.select_all_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(toolbar, text="Select All", variable=self.select_all_var,
+                        command=lambda: self.toggle_all_keywords(self.select_all_var.get())).pack(side="left")
+        ttk.Label(toolbar, text="Click Select or Match to change a row, double-click Format to edit it",
+                  foreground="gray").pack(side="right")
+
+        # Results table with scrollbar, a Treeview only draws the visible rows
         results_container = ttk.Frame(frame)
         results_container.pack(fill="both", expand=True, padx=20, pady=10)
 
-        # Add scrollbar
-        scrollbar = ttk.Scrollbar(results_container)
-        scrollbar.pack(side="right", fill="y")
-
-        # Create canvas for scrolling
-        canvas = tk.Canvas(results_container, yscrollcommand=scrollbar.set)
-        canvas.pack(side="left", fill="both", expand=True)
-
-        scrollbar.config(command=canvas.yview)
-
-        # Create frame for results inside canvas
-        self.results_frame = ttk.Frame(canvas)
-        canvas.create_window((0, 0), window=self.results_frame, anchor="nw")
-
-        # Configure scroll region when results frame changes
-        self.results_frame.bind("<Configure>",
-                                lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-
-        # Summary frame
+        self.keyword_scrollbar = ttk.Scrollbar(results_container)
+        self.keyword_scrollbar.pack(side="right", fill="y")
+
+        self.keyword_tree = ttk.Treeview(
+            results_container, columns=[column for column, _, _ in KEYWORD_COLUMNS],
+            show="headings", selectmode="browse", yscrollcommand=self.on_keyword_scroll)
+        for column, heading, width in KEYWORD_COLUMNS:
+            self.keyword_tree.heading(column, text=heading)
+            self.keyword_tree.column(column, width=width, anchor="center" if column == "selected" else "w")
+        self.keyword_tree.tag_configure("matched", foreground="green")
+        self.keyword_tree.tag_configure("unmatched", foreground="orange")
+        self.keyword_tree.pack(side="left", fill="both", expand=True)
+        self.keyword_scrollbar.config(command=self.keyword_tree.yview)
+
+        self.keyword_tree.bind("<Button-1>", self.on_keyword_click)
+        self.keyword_tree.bind("<Double-1>", self.on_keyword_double_click)
+        self.keyword_tree.bind("<space>", self.on_keyword_space)
+
+        # One combobox, moved over the Match cell being edited
+        self.match_editor = ttk.Combobox(self.keyword_tree, state="readonly")
+        self.match_editor_keyword = None
+        self.match_editor.bind("<<ComboboxSelected>>", self.on_match_selected)
+        self.match_editor.bind("<Escape>", lambda e: self.hide_match_editor())
+
+        # Summary frame, its labels are updated in place
         self.summary_frame = ttk.LabelFrame(
             frame, text="Matching Summary", padding=10)
         self.summary_frame.pack(fill="x", padx=20, pady=10)
+        self.summary_label = ttk.Label(self.summary_frame)
+        self.summary_label.pack()
+        self.summary_message = ttk.Label(self.summary_frame)
+        self.summary_message.pack()
 
         # Navigation buttons
         nav_frame = ttk.Frame(frame)
@@ -382,55 +332,116 @@ class DocumentAutomation:
 
     def toggle_all_keywords(self, select_all):
         """Toggle all keyword checkboxes"""
-        for var in self.keyword_checkboxes.values():
-            var.set(select_all)
+        for keyword in self.keyword_state:
+            self.set_keyword_selected(keyword, select_all)
         self.check_selected_keywords()
 
-    def auto_match_keywords(self, list_columns, template_keywords):
-        """Enhanced automatic matching of keywords with columns, especially for numeric patterns"""
-        matches = {}
-        
-        for keyword in template_keywords:
-            # Extract numbers from keyword
-            keyword_numbers = ''.join(filter(str.isdigit, keyword))
-            
-            # Try different matching strategies
-            for column in list_columns:
-                column_numbers = ''.join(filter(str.isdigit, column))
-                
-                # Strategy 1: Exact number match
-                if keyword_numbers and column_numbers and keyword_numbers == column_numbers:
-                    matches[keyword] = column
-                    break
-                    
-                # Strategy 2: Exact string match (case insensitive)
-                elif column.lower() == keyword.lower():
-                    matches[keyword] = column
-                    break
-                    
-                # Strategy 3: Number at the end match
-                elif keyword_numbers and column_numbers and keyword_numbers == column_numbers[-len(keyword_numbers):]:
-                    matches[keyword] = column
-                    break
-                    
-                # Strategy 4: Partial number match
-                elif keyword_numbers and column_numbers and (keyword_numbers in column_numbers or column_numbers in keyword_numbers):
-                    matches[keyword] = column
-                    break
-
-        return matches
-
-    def clean_string(self, text):
-        """Clean string for better matching"""
-        # Convert to lowercase
-        text = text.lower()
-        # Remove common symbols and separators
-        text = text.replace('_', '').replace('-', '').replace(' ', '')
-        # Remove common prefixes/suffixes
-        prefixes = ['$$', '##', '{{', '}}', '[[', ']]', '(', ')', '{', '}', '|']
-        for prefix in prefixes:
-            text = text.replace(prefix, '')
-        return text
+    def keyword_row(self, keyword):
+        """Cell values of a keyword's table row"""
+        state = self.keyword_state[keyword]
+        formats = []
+        for start_symbol, end_symbol in self.keyword_symbols[keyword]:
+            if end_symbol:
+                formats.append(f"{start_symbol}...{end_symbol}")
+            else:
+                formats.append(f"{start_symbol}")
+        if state['match_type']:
+            status = f"✓ {MATCH_LABELS[state['match_type']]}"
+        else:
+            status = "× Not matched"
+        return (CHECKED if state['selected'] else UNCHECKED, keyword, ", ".join(formats),
+                status, state['column'], self.update_format_preview(keyword))
+
+    def refresh_keyword_row(self, keyword):
+        """Redraw a single row after its state changed"""
+        tag = "matched" if self.keyword_state[keyword]['match_type'] else "unmatched"
+        self.keyword_tree.item(keyword, values=self.keyword_row(keyword), tags=(tag,))
+
+    def set_keyword_selected(self, keyword, selected):
+        """Select or unselect a keyword, keeping the counters up to date"""
+        state = self.keyword_state[keyword]
+        if state['selected'] == selected:
+            return
+        state['selected'] = selected
+        self.selected_count += 1 if selected else -1
+        if selected and not state['column']:
+            self.unmatched_selected[keyword] = True
+        else:
+            self.unmatched_selected.pop(keyword, None)
+        self.refresh_keyword_row(keyword)
+
+    def set_keyword_column(self, keyword, column):
+        """Match a keyword with a column picked by hand"""
+        state = self.keyword_state[keyword]
+        state['column'] = column
+        state['match_type'] = classify_match(keyword, column)
+        if column:
+            self.unmatched_selected.pop(keyword, None)
+        # Auto-check the checkbox for names that match up to case and symbols
+        if state['match_type'] in CONFIDENT_MATCH_TYPES:
+            self.set_keyword_selected(keyword, True)
+        self.refresh_keyword_row(keyword)
+        self.check_selected_keywords()
+
+    def on_keyword_scroll(self, first, last):
+        """Keep the scrollbar in sync, the cell editor does not follow the rows"""
+        self.keyword_scrollbar.set(first, last)
+        self.hide_match_editor()
+
+    def keyword_cell(self, event):
+        """Return (keyword, column id) of the table cell under the mouse, or (None, None)"""
+        if self.keyword_tree.identify_region(event.x, event.y) != "cell":
+            return None, None
+        keyword = self.keyword_tree.identify_row(event.y)
+        column_number = int(self.keyword_tree.identify_column(event.x)[1:]) - 1
+        return keyword or None, KEYWORD_COLUMNS[column_number][0]
+
+    def on_keyword_click(self, event):
+        """Toggle the Select cell or open the column picker of the Match cell"""
+        self.hide_match_editor()
+        keyword, column = self.keyword_cell(event)
+        if keyword is None:
+            return
+        if column == "selected":
+            self.set_keyword_selected(keyword, not self.keyword_state[keyword]['selected'])
+            self.check_selected_keywords()
+        elif column == "match":
+            self.show_match_editor(keyword)
+
+    def on_keyword_double_click(self, event):
+        """Edit the format of a keyword from its Format cell"""
+        keyword, column = self.keyword_cell(event)
+        if keyword is not None and column == "format":
+            self.edit_keyword_format(keyword)
+
+    def on_keyword_space(self, event):
+        """Toggle the focused row from the keyboard"""
+        keyword = self.keyword_tree.focus()
+        if keyword:
+            self.set_keyword_selected(keyword, not self.keyword_state[keyword]['selected'])
+            self.check_selected_keywords()
+
+    def show_match_editor(self, keyword):
+        """Place the column picker over the Match cell of a keyword"""
+        bbox = self.keyword_tree.bbox(keyword, "match")
+        if not bbox:
+            return
+        x, y, width, height = bbox
+        self.match_editor_keyword = keyword
+        self.match_editor.set(self.keyword_state[keyword]['column'])
+        self.match_editor.place(x=x, y=y, width=width, height=height)
+        self.match_editor.focus_set()
+
+    def hide_match_editor(self):
+        self.match_editor_keyword = None
+        self.match_editor.place_forget()
+
+    def on_match_selected(self, event):
+        """Apply the column picked in the cell editor"""
+        keyword = self.match_editor_keyword
+        self.hide_match_editor()
+        if keyword is not None:
+            self.set_keyword_column(keyword, self.match_editor.get())
 
     def create_output_frame(self):
         """Create the third frame for output settings"""
@@ -450,6 +461,54 @@ class DocumentAutomation:
         ttk.Checkbutton(format_group, text="Word Document",
                         variable=self.output_formats["docx"]).pack(anchor="w")
 
+        # PDF converter backend
+        converter_frame = ttk.Frame(format_group)
+        converter_frame.pack(anchor="w", pady=(5, 0))
+        ttk.Label(converter_frame, text="PDF converter:").pack(side="left", padx=5)
+        ttk.Combobox(converter_frame, textvariable=self.pdf_converter,
+                     values=list(CONVERTERS), state="readonly", width=15).pack(side="left")
+
+        # Stream the outputs into ZIP files instead of loose files
+        archive_frame = ttk.Frame(format_group)
+        archive_frame.pack(anchor="w", pady=(5, 0))
+        ttk.Label(archive_frame, text="ZIP archive:").pack(side="left", padx=5)
+        ttk.Combobox(archive_frame, textvariable=self.archive_mode,
+                     values=["none"] + list(ARCHIVE_MODES), state="readonly", width=15).pack(side="left")
+
+        # Append every row to one document, for printing
+        merge_frame = ttk.Frame(format_group)
+        merge_frame.pack(anchor="w", pady=(5, 0))
+        ttk.Label(merge_frame, text="Merge into one document:").pack(side="left", padx=5)
+        ttk.Combobox(merge_frame, textvariable=self.merge_mode,
+                     values=["none"] + list(MERGE_SEPARATORS), state="readonly", width=10).pack(side="left")
+        ttk.Label(merge_frame, text="Rows per volume (0 = all):").pack(side="left", padx=5)
+        ttk.Spinbox(merge_frame, from_=0, to=100000,
+                    textvariable=self.volume_size, width=7).pack(side="left")
+
+        # Rendering engine and parallel rendering
+        worker_group = ttk.LabelFrame(
+            frame, text="Rendering", padding=10)
+        worker_group.pack(fill="x", padx=20, pady=10)
+
+        ttk.Label(worker_group, text="Engine:").pack(side="left", padx=5)
+        ttk.Combobox(worker_group, textvariable=self.render_engine,
+                     values=list(RENDER_ENGINES), state="readonly", width=8).pack(side="left")
+        ttk.Label(worker_group, text="Worker processes:").pack(side="left", padx=5)
+        ttk.Spinbox(worker_group, from_=1, to=os.cpu_count() or 1,
+                    textvariable=self.worker_count, width=5).pack(side="left")
+
+        # Rerun only what is missing or failed, based on the job manifest
+        run_mode_group = ttk.LabelFrame(
+            frame, text="Run Mode", padding=10)
+        run_mode_group.pack(fill="x", padx=20, pady=10)
+
+        ttk.Radiobutton(run_mode_group, text="All rows", value="all",
+                        variable=self.run_mode).pack(side="left", padx=5)
+        ttk.Radiobutton(run_mode_group, text="Resume (skip finished rows)", value="resume",
+                        variable=self.run_mode).pack(side="left", padx=5)
+        ttk.Radiobutton(run_mode_group, text="Retry failed rows only", value="retry_failed",
+                        variable=self.run_mode).pack(side="left", padx=5)
+
         # Save location
         location_group = ttk.LabelFrame(
             frame, text="Save Location", padding=10)
@@ -478,7 +537,7 @@ class DocumentAutomation:
         new_format = dialog.get_format()
         if new_format:
             self.keyword_formats[keyword] = new_format
-            self.update_format_preview(keyword)
+            self.refresh_keyword_row(keyword)
 
     def update_format_preview(self, keyword):
         """Update the format preview for a keyword"""
@@ -495,43 +554,6 @@ class DocumentAutomation:
             return preview_text
         return "Default"
 
-    def find_name_column(self, columns):
-        """Find the name column using case-insensitive comparison"""
-        # Check for various possible name column formats
-        name_variants = ['name', 'names', 'full name',
-                         'fullname', '$$name', 'NAME', '$$NAME']
-        for column in columns:
-            # Convert to lowercase for comparison
-            col_lower = column.lower()
-            # Check if the column contains any of the name variants
-            if any(variant.lower() in col_lower for variant in name_variants):
-                return column
-        return None
-
-    def find_folder_column(self, columns):
-        """Find the folder column regardless of case"""
-        folder_variants = ['folder', 'folder_name', 'foldername']
-        for column in columns:
-            if column.lower() in folder_variants:
-                return column
-        return None
-
-    def auto_match_keywords(self, list_columns, template_keywords):
-        """Automatically match keywords with columns using case-insensitive comparison"""
-        matches = {}
-        for keyword in template_keywords:
-            keyword_lower = keyword.lower()
-            # Try exact match first
-            if keyword in list_columns:
-                matches[keyword] = keyword
-            else:
-                # Try case-insensitive match
-                for column in list_columns:
-                    if column.lower() == keyword_lower:
-                        matches[keyword] = column
-                        break
-        return matches
-
     def check_and_proceed(self):
         """Validate files and proceed to keyword matching step"""
         if not self.template_path.get() or not self.list_path.get():
@@ -539,254 +561,53 @@ class DocumentAutomation:
             return
 
         # Clear previous results
-        for widget in self.results_frame.winfo_children():
-            widget.destroy()
-        for widget in self.summary_frame.winfo_children():
-            widget.destroy()
+        self.hide_match_editor()
+        self.keyword_tree.delete(*self.keyword_tree.get_children())
+        self.keyword_state = {}
+        self.selected_count = 0
+        self.unmatched_selected = {}
+        self.select_all_var.set(False)
 
         # Get keywords and columns
         template_keywords = self.detect_template_keywords()
         list_columns = self.detect_list_columns()
+        self.match_editor.config(values=list_columns)
 
-        # Auto-match keywords
-        auto_matches = self.auto_match_keywords(list_columns, template_keywords)
-
-        # Create header container frames
-        headers = ["Select All", "Keyword", "Format(s)", "Status", "Match", "Format"]
-        header_frames = []
-        
-        for col, header in enumerate(headers):
-            # Create a frame for each header to contain both checkbox and label if needed
-            header_frame = ttk.Frame(self.results_frame)
-            header_frame.grid(row=0, column=col, padx=5, pady=5)
-            header_frames.append(header_frame)
-            
-            if col == 0:  # Special handling for "Select All" header
-                # Add checkbox
-                select_all_var = tk.BooleanVar(value=False)
-                select_all_chk = ttk.Checkbutton(
-                    header_frame,
-                    variable=select_all_var,
-                    command=lambda: self.toggle_all_keywords(select_all_var.get())
-                )
-                select_all_chk.pack(side="left")
-                
-                # Add label
-                ttk.Label(
-                    header_frame,
-                    text="Select All",
-                    font=("Helvetica", 10, "bold")
-                ).pack(side="left")
-            else:
-                # Regular headers
-                ttk.Label(
-                    header_frame,
-                    text=header,
-                    font=("Helvetica", 10, "bold")
-                ).pack()
-
-        self.keyword_checkboxes.clear()
-        self.keywords = []
-        self.status_labels = {}  # Store status labels for updating
-
-        def is_exact_match(keyword, column):
-            """Check if keyword exactly matches the column name"""
-            # Remove symbols and compare
-            keyword_clean = self.clean_string(keyword)
-            column_clean = self.clean_string(column)
-            return keyword_clean == column_clean
-
-        for i, keyword in enumerate(template_keywords, 1):
-            # Check for exact match in auto_matches
-            is_matched = False
-            if keyword in auto_matches:
-                is_matched = is_exact_match(keyword, auto_matches[keyword])
-
-            # Checkbox (only pre-selected if exact match)
-            var = tk.BooleanVar(value=is_matched)
-            self.keyword_checkboxes[keyword] = var
-            chk = ttk.Checkbutton(self.results_frame, variable=var, command=self.check_selected_keywords)
-            chk.grid(row=i, column=0, padx=5, pady=2)
-
-            # Keyword
-            ttk.Label(self.results_frame, text=keyword).grid(row=i, column=1, padx=5, pady=2)
-
-            # Format column
-            formats = []
-            for start_symbol, end_symbol in self.keyword_symbols[keyword]:
-                if end_symbol:
-                    formats.append(f"{start_symbol}...{end_symbol}")
-                else:
-                    formats.append(f"{start_symbol}")
-            ttk.Label(self.results_frame, text=", ".join(formats)).grid(row=i, column=2, padx=5, pady=2)
-
-            # Status and Match
-            status_label = ttk.Label(self.results_frame, text="× Not matched", foreground="orange")
-            status_label.grid(row=i, column=3, padx=5, pady=2)
-            self.status_labels[keyword] = status_label
-
-            combo = ttk.Combobox(self.results_frame, values=list_columns, state="readonly", width=30)
-            combo.grid(row=i, column=4, padx=5, pady=2)
-            
-            # Set auto-matched value if exists
-            if keyword in auto_matches:
-                combo.set(auto_matches[keyword])
-                self.update_status(keyword, auto_matches[keyword])
-
-            # Bind the combobox selection event
-            combo.bind('<<ComboboxSelected>>', lambda e, k=keyword, c=combo: self.check_match(k, c))
-
-            # Format button
-            format_button = ttk.Button(
-                self.results_frame,
-                text="Edit Format",
-                command=lambda k=keyword: self.edit_keyword_format(k)
-            )
-            format_button.grid(row=i, column=5, padx=5, pady=2)
-
-            # Format preview label
-            format_preview = ttk.Label(self.results_frame, text=self.update_format_preview(keyword))
-            format_preview.grid(row=i, column=6, padx=5, pady=2)
+        # Auto-match keywords, (column, match type) per keyword
+        auto_matches = ColumnMatcher(list_columns).match_all(template_keywords)
 
-            self.keywords.append((keyword, combo))
+        for keyword in template_keywords:
+            column, match_type = auto_matches.get(keyword, (None, None))
+            self.keyword_state[keyword] = {'selected': False, 'column': column or "", 'match_type': match_type}
+            self.keyword_tree.insert("", "end", iid=keyword)
+            # Only names matching up to case and symbols are selected right away
+            if match_type in CONFIDENT_MATCH_TYPES:
+                self.set_keyword_selected(keyword, True)
+            else:
+                self.refresh_keyword_row(keyword)
 
         self.check_selected_keywords()
         self.show_keyword_frame()
 
-    def check_match(self, keyword, combo):
-        """Check if selected column matches the keyword and update status and checkbox"""
-        selected_column = combo.get()
-        if selected_column:
-            keyword_clean = self.clean_string(keyword)
-            column_clean = self.clean_string(selected_column)
-            
-            # Check for matches
-            is_match = False
-            match_type = ""
-
-            # Exact match (case-insensitive)
-            if keyword_clean == column_clean:
-                is_match = True
-                match_type = "Exact match"
-                # Auto-check the checkbox for exact matches
-                self.keyword_checkboxes[keyword].set(True)
-            
-            # Number match
-            elif self.extract_numbers(keyword_clean) == self.extract_numbers(column_clean):
-                is_match = True
-                match_type = "Number match"
-            
-            # Partial text match
-            elif keyword_clean in column_clean or column_clean in keyword_clean:
-                is_match = True
-                match_type = "Text match"
-
-            # Update status label
-            if is_match:
-                self.status_labels[keyword].config(
-                    text=f"✓ {match_type}",
-                    foreground="green"
-                )
-            else:
-                self.status_labels[keyword].config(
-                    text="× Not matched",
-                    foreground="orange"
-                )
-                
-            # After status update, check if we need to update the "Select All" state
-            self.check_selected_keywords()
-    
-    def extract_numbers(self, text):
-        """Extract only numbers from text"""
-        return ''.join(filter(str.isdigit, text))
-
-    def update_status(self, keyword, column):
-        """Update the status label based on match detection"""
-        keyword_clean = self.clean_string(keyword)
-        column_clean = self.clean_string(column)
-
-        # Check for matches
-        is_match = False
-        match_type = ""
-
-        # Exact match (case-insensitive)
-        if keyword_clean == column_clean:
-            is_match = True
-            match_type = "Exact match"
-        
-        # Number match
-        elif self.extract_numbers(keyword_clean) == self.extract_numbers(column_clean):
-            is_match = True
-            match_type = "Number match"
-        
-        # Partial text match
-        elif keyword_clean in column_clean or column_clean in keyword_clean:
-            is_match = True
-            match_type = "Text match"
-
-        # Update status label
-        if is_match:
-            self.status_labels[keyword].config(
-                text=f"✓ {match_type}",
-                foreground="green"
-            )
-        else:
-            self.status_labels[keyword].config(
-                text="× Not matched",
-                foreground="orange"
-            )
-
-    def clean_string(self, text):
-        """Clean string for matching by removing symbols and converting to lowercase"""
-        # Convert to lowercase
-        text = text.lower().strip()
-        # Remove common symbols and separators
-        text = text.replace('_', '').replace('-', '').replace(' ', '')
-        # Remove common prefixes/suffixes
-        prefixes = ['$$', '##', '{{', '}}', '[[', ']]', '(', ')', '{', '}', '|']
-        for prefix in prefixes:
-            text = text.replace(prefix, '')
-        return text
-
     def check_selected_keywords(self):
-        """Update summary and continue button based on selected keywords and their matches"""
-        # Count selected keywords
-        selected_count = 0
-        unmatched_keywords = []
-        
-        # Check each selected keyword for a match
-        for keyword, var in self.keyword_checkboxes.items():
-            if var.get():  # If checkbox is selected
-                selected_count += 1
-                # Find corresponding combobox
-                matched = False
-                for kw, combo in self.keywords:
-                    if kw == keyword:
-                        if not combo.get():  # If no match selected
-                            unmatched_keywords.append(keyword)
-                        break
-
-        total_keywords = len(self.keyword_checkboxes)
-
-        # Update summary
-        for widget in self.summary_frame.winfo_children():
-            widget.destroy()
-
-        summary_text = f"Selected {selected_count} out of {total_keywords} keywords"
-        ttk.Label(self.summary_frame, text=summary_text).pack()
+        """Update summary and continue button from the selection counters"""
+        total_keywords = len(self.keyword_state)
+        self.summary_label.config(text=f"Selected {self.selected_count} out of {total_keywords} keywords")
 
         # Enable/disable continue button based on selection and matches
-        if selected_count > 0 and not unmatched_keywords:
+        if self.selected_count > 0 and not self.unmatched_selected:
             self.continue_button.config(state="normal")
-            message = "You can proceed to output settings."
-            ttk.Label(self.summary_frame, text=message, foreground="green").pack()
+            self.summary_message.config(text="You can proceed to output settings.", foreground="green")
         else:
             self.continue_button.config(state="disabled")
-            if selected_count == 0:
+            if self.selected_count == 0:
                 message = "Please select at least one keyword to proceed."
             else:
+                unmatched_keywords = list(islice(self.unmatched_selected, SUMMARY_KEYWORD_LIMIT))
                 message = f"Please select matches for: {', '.join(unmatched_keywords)}"
-            ttk.Label(self.summary_frame, text=message, foreground="orange").pack()
+                if len(self.unmatched_selected) > SUMMARY_KEYWORD_LIMIT:
+                    message += f" (and {len(self.unmatched_selected) - SUMMARY_KEYWORD_LIMIT} more)"
+            self.summary_message.config(text=message, foreground="orange")
 
     def detect_template_keywords(self):
         """Detect keywords from template document, including all possible text locations"""
@@ -794,46 +615,8 @@ class DocumentAutomation:
             return []
 
         try:
-            doc = Document(self.template_path.get())
-            all_text = []
-
-            # Process regular paragraphs
-            for paragraph in doc.paragraphs:
-                all_text.append(paragraph.text)
-
-            # Process tables and nested tables
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        # Handle paragraphs within cells
-                        for paragraph in cell.paragraphs:
-                            if paragraph.text.strip():
-                                all_text.append(paragraph.text)
-
-                        # Handle nested tables
-                        for nested_table in cell.tables:
-                            for nested_row in nested_table.rows:
-                                for nested_cell in nested_row.cells:
-                                    for nested_para in nested_cell.paragraphs:
-                                        if nested_para.text.strip():
-                                            all_text.append(nested_para.text)
-
-            # Process shapes and text boxes
-            for shape in doc.inline_shapes:
-                if hasattr(shape, 'text_frame'):
-                    for paragraph in shape.text_frame.paragraphs:
-                        if paragraph.text.strip():
-                            all_text.append(paragraph.text)
-
-            # Process floating shapes and text boxes (in document._element.body)
-            for shape in doc._element.findall('.//w:txbxContent/w:p', doc._element.nsmap):
-                text = shape.xpath('string()')
-                if text.strip():
-                    all_text.append(text)
-
-            # Combine all text and detect keywords
-            text = '\n'.join(all_text)
-            keywords = self.detect_keywords(text)
+            keywords, self.keyword_symbols = detect_template_keywords(
+                self.template_path.get())
 
             # Update preview
             if keywords:
@@ -855,13 +638,8 @@ class DocumentAutomation:
             return []
 
         try:
-            # Read file
-            if self.list_path.get().endswith('.xlsx'):
-                df = pd.read_excel(self.list_path.get())
-            else:
-                df = pd.read_csv(self.list_path.get())
-
-            columns = list(df.columns)
+            # Only the header row is read, the rows are streamed when generating
+            columns = list(open_data_source(self.list_path.get()).columns)
 
             # Update preview
             if columns:
@@ -889,200 +667,124 @@ class DocumentAutomation:
             return
 
         try:
-            # Read data
-            df = pd.read_excel(self.list_path.get()) if self.list_path.get().endswith(
-                '.xlsx') else pd.read_csv(self.list_path.get())
-
-            # Find name and folder columns
-            name_column = self.find_name_column(df.columns)
-            folder_column = self.find_folder_column(df.columns)
-
-            if not name_column:
-                messagebox.showerror(
-                    "Error", "Name column not found in list file. Please ensure you have a column with 'name' in it (case insensitive).")
-                return
-
             # Create mapping from keywords to column names
-            mapping = {}
-            for keyword, var in self.keyword_checkboxes.items():
-                if var.get():  # Only process selected keywords
-                    for kw, combo in self.keywords:
-                        if kw == keyword and combo.get():
-                            mapping[keyword] = combo.get()
+            mapping = {keyword: state['column'] for keyword, state in self.keyword_state.items()
+                       if state['selected'] and state['column']}
+
+            job = RenderJob(
+                self.template_path.get(),
+                self.list_path.get(),
+                mapping,
+                self.keyword_symbols,
+                self.save_location.get(),
+                formats=[format_type for format_type, format_var in self.output_formats.items()
+                         if format_var.get()],
+                keyword_formats=self.keyword_formats,
+                workers=self.worker_count.get(),
+                converter=self.pdf_converter.get(),
+                render_engine=self.render_engine.get(),
+                run_mode=self.run_mode.get(),
+                archive=None if self.archive_mode.get() == "none" else self.archive_mode.get(),
+                merge=None if self.merge_mode.get() == "none" else self.merge_mode.get(),
+                volume_size=self.volume_size.get(),
+            )
 
             # Create progress window
             progress_window = tk.Toplevel(self.root)
             progress_window.title("Processing Files")
-            progress_window.geometry("400x150")
+            progress_window.geometry("400x200")
             progress_window.transient(self.root)
+            progress_window.grab_set()
 
             # Center progress window
             progress_window.geometry("+%d+%d" % (
                 self.root.winfo_x() + self.root.winfo_width()/2 - 200,
-                self.root.winfo_y() + self.root.winfo_height()/2 - 75))
+                self.root.winfo_y() + self.root.winfo_height()/2 - 100))
 
             # Add progress label and bar
             progress_label = ttk.Label(progress_window, text="Processing files...")
             progress_label.pack(pady=10)
             progress_bar = ttk.Progressbar(progress_window, length=300, mode='determinate')
-            progress_bar.pack(pady=10)
+            progress_bar.pack(pady=5)
             file_label = ttk.Label(progress_window, text="")
-            file_label.pack(pady=10)
+            file_label.pack(pady=5)
+            rate_label = ttk.Label(progress_window, text="")
+            rate_label.pack(pady=5)
+
+            def cancel():
+                """Stop the job after the rows in progress"""
+                job.cancel()
+                cancel_button.config(state="disabled", text="Cancelling...")
+
+            cancel_button = ttk.Button(progress_window, text="Cancel", command=cancel)
+            cancel_button.pack(pady=5)
+            progress_window.protocol("WM_DELETE_WINDOW", cancel)
 
-            # Process each row
-            total_files = len(df)
-            successful_files = 0
-            failed_files = []
-            progress_bar['maximum'] = total_files
+            # The job runs on a worker thread and reports through a queue,
+            # the window is only updated from the Tk event loop
+            events = queue.Queue()
+            stage_started = {}
 
-            for index, row in df.iterrows():
+            def report_progress(stage, done, total):
+                """Called on the worker thread"""
+                events.put(('progress', stage, done, total))
+
+            def run_job():
                 try:
-                    # Update progress
-                    progress_bar['value'] = index + 1
-                    file_label.config(text=f"Processing file {index + 1} of {total_files}")
-                    progress_window.update()
-
-                    # Create new document from template
-                    doc = Document(self.template_path.get())
-
-                    # Process regular paragraphs
-                    for paragraph in doc.paragraphs:
-                        self._replace_keywords_in_paragraph(paragraph, row, mapping)
-
-                    # Process tables and nested tables
-                    for table in doc.tables:
-                        for table_row in table.rows:
-                            for cell in table_row.cells:
-                                # Process paragraphs within cells
-                                for paragraph in cell.paragraphs:
-                                    self._replace_keywords_in_paragraph(paragraph, row, mapping)
-
-                                # Process nested tables
-                                for nested_table in cell.tables:
-                                    for nested_row in nested_table.rows:
-                                        for nested_cell in nested_row.cells:
-                                            for nested_para in nested_cell.paragraphs:
-                                                self._replace_keywords_in_paragraph(nested_para, row, mapping)
-
-                    # Process shapes and text boxes
-                    for shape in doc.inline_shapes:
-                        if hasattr(shape, 'text_frame'):
-                            for paragraph in shape.text_frame.paragraphs:
-                                self._replace_keywords_in_paragraph(paragraph, row, mapping)
-
-                    # Process floating shapes and text boxes
+                    events.put(('done', job.run(progress=report_progress)))
+                except Exception as job_error:
+                    events.put(('error', job_error))
+
+            def update_progress(stage, done, total):
+                """Update progress window"""
+                now = time.monotonic()
+                started, started_done = stage_started.setdefault(stage, (now, done))
+                progress_bar['maximum'] = max(total, 1)
+                progress_bar['value'] = done
+                if stage == 'render':
+                    file_label.config(text=f"Processing file {done} of {total}")
+                else:
+                    file_label.config(text=f"Converting to PDF: {done} of {total} files")
+
+                # Speed since the stage started, and the time left at that speed
+                elapsed = now - started
+                if elapsed > 0 and done > started_done:
+                    rate = (done - started_done) / elapsed
+                    remaining = int((total - done) / rate)
+                    rate_label.config(
+                        text=f"{rate:.1f} files/sec, about {remaining // 60}:{remaining % 60:02d} left")
+
+            def poll_events():
+                """Drain the queue and show only the latest progress"""
+                latest = None
+                while True:
                     try:
-                        for shape in doc._element.findall('.//w:txbxContent/w:p', doc._element.nsmap):
-                            text = shape.xpath('string()')
-                            if text.strip():
-                                # Create a temporary paragraph object for processing
-                                temp_paragraph = doc.add_paragraph()
-                                temp_paragraph.text = text
-                                self._replace_keywords_in_paragraph(temp_paragraph, row, mapping)
-                                # Update the shape text with the processed text
-                                shape.text = temp_paragraph.text
-                                # Remove the temporary paragraph
-                                temp_paragraph._element.getparent().remove(temp_paragraph._element)
-                    except Exception as shape_error:
-                        print(f"Warning: Error processing shapes in document: {str(shape_error)}")
-
-                    # Get output name from name column - handle empty or invalid values
-                    output_name = str(row[name_column]).strip()
-                    if not output_name:
-                        output_name = f"document_{index + 1}"
-                    # Clean the output name
-                    output_name = "".join(
-                        x for x in output_name if x.isalnum() or x in (' ', '-', '_'))
-                    if not output_name:  # If after cleaning the name is empty
-                        output_name = f"document_{index + 1}"
-
-                    # Get custom folder name or use default
-                    folder_name = str(row[folder_column]) if folder_column and pd.notna(
-                        row[folder_column]) else "default"
-                    folder_name = "".join(
-                        x for x in folder_name if x.isalnum() or x in (' ', '-', '_'))
-                    if not folder_name:  # If after cleaning the folder name is empty
-                        folder_name = "default"
-
-                    # Create base directory for this record
-                    record_base_dir = Path(self.save_location.get()) / folder_name
-
-                    # Create format-specific subdirectories
-                    output_dirs = {}
-                    for format_type, format_var in self.output_formats.items():
-                        if format_var.get():
-                            output_dir = record_base_dir / format_type
-                            output_dir.mkdir(parents=True, exist_ok=True)
-                            output_dirs[format_type] = output_dir
-
-                    # Save in selected formats
-                    if self.output_formats["docx"].get():
-                        docx_path = output_dirs["docx"] / f"{output_name}.docx"
-                        doc.save(docx_path)
-
-                    if self.output_formats["pdf"].get():
-                        pdf_dir = output_dirs["pdf"]
-                        temp_docx = pdf_dir / f"{output_name}.docx"
-                        pdf_path = pdf_dir / f"{output_name}.pdf"
-
-                        # Save temporary docx for PDF conversion
-                        doc.save(temp_docx)
-                        try:
-                            convert(str(temp_docx), str(pdf_path))
-                            # Remove temporary docx file after successful PDF conversion
-                            temp_docx.unlink()
-                        except Exception as pdf_error:
-                            failed_files.append(
-                                (output_name, f"PDF conversion error: {str(pdf_error)}"))
-                            continue
-
-                    successful_files += 1
-
-                except Exception as row_error:
-                    failed_files.append((output_name, str(row_error)))
-                    continue
-
-                # Update progress window
-                progress_window.update()
-
-            # Close progress window
-            progress_window.destroy()
-
-            # Show completion message
-            completion_message = f"Processing complete!\n\n"
-            completion_message += f"Successfully processed: {successful_files} files\n"
-
-            if failed_files:
-                completion_message += f"\nFailed to process {len(failed_files)} files:\n"
-                # Show first 5 failures
-                for failed_file, error in failed_files[:5]:
-                    completion_message += f"- {failed_file}: {error}\n"
-                if len(failed_files) > 5:
-                    completion_message += f"(and {len(failed_files) - 5} more...)\n"
-
-            completion_message += f"\nFiles have been saved to:\n{self.save_location.get()}" \
-                                f"\n\nWould you like to open the output folder?"
-
-            result = messagebox.askquestion(
-                "Processing Complete",
-                completion_message,
-                icon='info'
-            )
-
-            # Open folder if requested
-            if result == 'yes':
-                os.startfile(str(self.save_location.get()))
+                        event = events.get_nowait()
+                    except queue.Empty:
+                        break
+                    if event[0] == 'progress':
+                        latest = event[1:]
+                        continue
+
+                    progress_window.destroy()
+                    if event[0] == 'done':
+                        self.show_completion(event[1])
+                    elif isinstance(event[1], JobError):
+                        messagebox.showerror("Error", str(event[1]))
+                    else:
+                        messagebox.showerror(
+                            "Error",
+                            f"An error occurred during processing:\n{str(event[1])}\n\n"
+                            "Please check your input files and try again."
+                        )
+                    return
 
-            # Reset the form
-            self.template_path.set("")
-            self.list_path.set("")
-            self.save_location.set("")
-            self.template_preview.config(text="")
-            self.list_preview.config(text="")
-            self.keyword_formats.clear()
+                if latest:
+                    update_progress(*latest)
+                self.root.after(PROGRESS_INTERVAL_MS, poll_events)
 
-            # Return to first page
-            self.show_upload_frame()
+            threading.Thread(target=run_job, daemon=True).start()
+            self.root.after(PROGRESS_INTERVAL_MS, poll_events)
 
         except Exception as e:
             messagebox.showerror(
@@ -1092,37 +794,61 @@ class DocumentAutomation:
             )
             return
 
-    def _replace_keywords_in_paragraph(self, paragraph, row, mapping):
-        """Helper method to replace keywords in a paragraph with proper formatting"""
-        for keyword in mapping:
-            if keyword in self.keyword_symbols:
-                for start_symbol, end_symbol in self.keyword_symbols[keyword]:
-                    if end_symbol:
-                        original = start_symbol + keyword + end_symbol
-                    else:
-                        original = start_symbol + keyword
-
-                    if original in paragraph.text:
-                        new_value = str(row[mapping[keyword]])
-
-                        # Find the run containing the keyword and apply formatting
-                        for run in paragraph.runs:
-                            if original in run.text:
-                                # Apply formatting if specified
-                                if keyword in self.keyword_formats:
-                                    format_settings = self.keyword_formats[keyword]
-                                    run.font.name = format_settings['font_name']
-                                    run.font.size = Pt(
-                                        format_settings['font_size'])
-                                    run.font.color.rgb = RGBColor.from_string(
-                                        format_settings['font_color'][1:])
-                                    run.font.bold = format_settings['bold']
-                                    run.font.italic = format_settings['italic']
-                                    run.font.underline = format_settings['underline']
-
-                                # Replace text
-                                run.text = run.text.replace(
-                                    original, new_value)
+    def show_completion(self, summary):
+        """Show the result of a finished job and reset the form"""
+        successful_files = summary['successful']
+        failed_files = summary['failed']
+
+        # Show completion message
+        if summary['cancelled']:
+            completion_message = f"Processing cancelled.\n\n"
+        else:
+            completion_message = f"Processing complete!\n\n"
+        completion_message += f"Successfully processed: {successful_files} files\n"
+        if summary['skipped']:
+            completion_message += f"Skipped (already done): {summary['skipped']} files\n"
+        if summary['cache_hits']:
+            completion_message += f"Reused identical documents: {summary['cache_hits']} files " \
+                                  f"({summary['cache_misses']} rendered)\n"
+
+        if failed_files:
+            completion_message += f"\nFailed to process {len(failed_files)} files:\n"
+            # Show first 5 failures
+            for failed_file, error in failed_files[:5]:
+                completion_message += f"- {failed_file}: {error}\n"
+            if len(failed_files) > 5:
+                completion_message += f"(and {len(failed_files) - 5} more...)\n"
+
+        if summary['cancelled'] and not summary['archives']:
+            completion_message += "\nRun again in Resume mode to generate the remaining files.\n"
+        if summary['archives']:
+            completion_message += f"\nArchives written: {len(summary['archives'])}\n"
+        if summary['volumes']:
+            completion_message += f"\nMerged documents written: {len(summary['volumes'])}\n"
+
+        completion_message += f"\nFiles have been saved to:\n{summary['save_location']}" \
+                            f"\n\nWould you like to open the output folder?"
+
+        result = messagebox.askquestion(
+            "Processing Cancelled" if summary['cancelled'] else "Processing Complete",
+            completion_message,
+            icon='info'
+        )
+
+        # Open folder if requested
+        if result == 'yes':
+            os.startfile(str(summary['save_location']))
+
+        # Reset the form
+        self.template_path.set("")
+        self.list_path.set("")
+        self.save_location.set("")
+        self.template_preview.config(text="")
+        self.list_preview.config(text="")
+        self.keyword_formats.clear()
+
+        # Return to first page
+        self.show_upload_frame()
 
     def browse_template(self):
         """Open file dialog for template selection"""
@@ -1166,7 +892,7 @@ class DocumentAutomation:
 
     def show_output_frame(self):
         """Switch to output frame"""
-        if not any(var.get() for var in self.keyword_checkboxes.values()):
+        if not self.selected_count:
             messagebox.showerror(
                 "Error", "Please select at least one keyword to proceed")
             return
@@ -0,0 +1,138 @@
+import hashlib
+import json
+from pathlib import Path
+
+# Written in the save location, dots never survive clean_names so no output folder can clash
+MANIFEST_NAME = 'render_manifest.jsonl'
+
+# all: render every row, resume: skip rows already rendered with the same
+# inputs, retry_failed: only render rows that failed in an earlier run
+RUN_MODES = ('all', 'resume', 'retry_failed')
+
+
+def file_hash(path):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _json_sha256(value):
+    """SHA-256 object of a JSON serializable value"""
+    data = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode('utf-8'))
+
+
+def _json_hash(value):
+    """SHA-256 of a JSON serializable value"""
+    return _json_sha256(value).hexdigest()
+
+
+def job_hash(template_hash, mapping, formats, keyword_formats):
+    """Hash of every job setting that changes the content of the outputs"""
+    return _json_hash([template_hash, mapping, sorted(formats), keyword_formats])
+
+
+def row_hash(output_name, folder_name, values):
+    """Hash of the prepared values of a row and the names its outputs get"""
+    return _json_hash([output_name, folder_name, values])
+
+
+def content_hash(values, job_digest):
+    """
+    Hash of everything that goes into a rendered document, but not its name.
+    Raw bytes rather than hex, one is kept for every distinct row of a run.
+    """
+    return _json_sha256([job_digest, values]).digest()
+
+
+class JobManifest:
+    """
+    JSON lines file recording the outcome of every row of a run, so a crashed
+    or partly failed run can be resumed instead of starting over.
+    Each run appends a 'job' line followed by one 'row' line per finished row,
+    the last line written for a row index wins when loading.
+    """
+
+    def __init__(self, save_location, path=None):
+        # Shards of a sharded run each keep their own manifest elsewhere
+        self.path = Path(path) if path else Path(save_location) / MANIFEST_NAME
+        self.job_digest = None
+        self._file = None
+        self._run_start = 0  # Offset of the current run's job line
+
+    def load(self):
+        """Return {index: row entry} from earlier runs, empty if there is no manifest"""
+        entries = {}
+        if not self.path.exists():
+            return entries
+        with open(self.path, encoding='utf-8') as manifest_file:
+            for line in manifest_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Line cut short by a crash
+                if entry.get('type') == 'row':
+                    entries[entry['index']] = (
+                        entry['status'], entry['row_hash'], entry['job_hash'],
+                        tuple(entry['outputs']))
+        return entries
+
+    def open(self, job_digest, **job_info):
+        """Start appending a new run to the manifest"""
+        self.job_digest = job_digest
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Line buffered so every finished row is on disk if the run crashes
+        self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+        self._run_start = self._file.tell()
+        self._write(dict(type='job', job_hash=job_digest, **job_info))
+
+    def run_outputs(self, indices):
+        """Return {index: outputs} of the rows in indices recorded by the current run"""
+        outputs = {}
+        self._file.flush()
+        with open(self.path, encoding='utf-8') as manifest_file:
+            manifest_file.seek(self._run_start)
+            for line in manifest_file:
+                entry = json.loads(line)
+                if entry.get('type') == 'row' and entry['index'] in indices:
+                    outputs[entry['index']] = entry['outputs']
+        return outputs
+
+    def record(self, index, output_name, row_digest, outputs, error=None):
+        """Record the outcome of one row"""
+        self._write({
+            'type': 'row',
+            'index': index,
+            'name': output_name,
+            'row_hash': row_digest,
+            'job_hash': self.job_digest,
+            'outputs': list(outputs),
+            'status': 'failed' if error else 'ok',
+            'error': error,
+        })
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def should_skip(entry, row_digest, job_digest, outputs, run_mode):
+    """
+    Decide if a row can be skipped given its entry from an earlier run.
+    Resume skips rows whose outputs exist and were made from the same values,
+    template and formats. Retry failed skips every row that did not fail.
+    """
+    if run_mode == 'retry_failed':
+        return entry is None or entry[0] != 'failed'
+    if run_mode == 'resume':
+        return (entry is not None
+                and entry == ('ok', row_digest, job_digest, tuple(outputs))
+                and all(Path(path).exists() for path in outputs))
+    return False
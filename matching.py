@@ -0,0 +1,137 @@
+import re
+
+# Match types from the strongest to the weakest, a keyword takes the first tier that matches
+MATCH_TYPES = ('exact', 'case_insensitive', 'cleaned', 'number', 'suffix_number', 'partial')
+
+# Status text shown for each match type
+MATCH_LABELS = {
+    'exact': "Exact match",
+    'case_insensitive': "Case-insensitive match",
+    'cleaned': "Cleaned match",
+    'number': "Number match",
+    'suffix_number': "Suffix number match",
+    'partial': "Partial match",
+}
+
+# Types close enough to the keyword to be selected without asking
+CONFIDENT_MATCH_TYPES = ('exact', 'case_insensitive', 'cleaned')
+
+# Separators and placeholder symbols ignored when names are compared
+_IGNORED_CHARS = re.compile(r'[_\-\s$#{}\[\]()|]')
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def clean_string(text):
+    """Lowercase text without separators and placeholder symbols, for loose comparisons"""
+    return _IGNORED_CHARS.sub('', text.lower())
+
+
+def extract_numbers(text):
+    """Digits of text in order, its digit signature"""
+    return _NON_DIGITS.sub('', text)
+
+
+def classify_match(keyword, column):
+    """
+    Match type between a keyword and a column picked by hand, None when they
+    do not match. Partial matches also accept one cleaned name inside the other.
+    """
+    if keyword == column:
+        return 'exact'
+    if keyword.lower() == column.lower():
+        return 'case_insensitive'
+    keyword_clean = clean_string(keyword)
+    column_clean = clean_string(column)
+    if keyword_clean == column_clean:
+        return 'cleaned'
+
+    keyword_numbers = extract_numbers(keyword)
+    column_numbers = extract_numbers(column)
+    if keyword_numbers and column_numbers:
+        if keyword_numbers == column_numbers:
+            return 'number'
+        if column_numbers.endswith(keyword_numbers):
+            return 'suffix_number'
+        if keyword_numbers in column_numbers or column_numbers in keyword_numbers:
+            return 'partial'
+    if keyword_clean and column_clean and (keyword_clean in column_clean or column_clean in keyword_clean):
+        return 'partial'
+    return None
+
+
+def _substrings(text):
+    """Every non-empty substring of text"""
+    return {text[start:end] for start in range(len(text)) for end in range(start + 1, len(text) + 1)}
+
+
+class ColumnMatcher:
+    """
+    Columns of a list file indexed once by name, lowercase name, cleaned name
+    and digit signature (whole, suffixes and substrings). Every keyword is then
+    resolved with a few dictionary lookups instead of a scan of all columns.
+    When several columns fit the same tier the leftmost one wins.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.positions = {}  # Column -> position, the first one for duplicated names
+        self.lower = {}
+        self.cleaned = {}
+        self.numbers = {}  # Digit signature -> column
+        self.suffixes = {}  # Trailing digits -> column
+        self.partial_numbers = {}  # Any run of digits of the signature -> column
+
+        for position, column in enumerate(self.columns):
+            self.positions.setdefault(column, position)
+            self.lower.setdefault(column.lower(), column)
+            self.cleaned.setdefault(clean_string(column), column)
+
+            numbers = extract_numbers(column)
+            if not numbers:
+                continue
+            self.numbers.setdefault(numbers, column)
+            for start in range(len(numbers)):
+                self.suffixes.setdefault(numbers[start:], column)
+            for digits in _substrings(numbers):
+                self.partial_numbers.setdefault(digits, column)
+
+    def match(self, keyword):
+        """Return (column, match type) for a keyword, (None, None) when nothing matches"""
+        if keyword in self.positions:
+            return keyword, 'exact'
+        column = self.lower.get(keyword.lower())
+        if column is not None:
+            return column, 'case_insensitive'
+        keyword_clean = clean_string(keyword)
+        column = self.cleaned.get(keyword_clean) if keyword_clean else None
+        if column is not None:
+            return column, 'cleaned'
+
+        numbers = extract_numbers(keyword)
+        if not numbers:
+            return None, None
+        column = self.numbers.get(numbers)
+        if column is not None:
+            return column, 'number'
+        column = self.suffixes.get(numbers)
+        if column is not None:
+            return column, 'suffix_number'
+        column = self.partial_numbers.get(numbers)
+        if column is not None:
+            return column, 'partial'
+
+        # A column whose whole signature appears inside the keyword's, leftmost column first
+        candidates = [self.numbers[digits] for digits in _substrings(numbers) if digits in self.numbers]
+        if candidates:
+            return min(candidates, key=self.positions.get), 'partial'
+        return None, None
+
+    def match_all(self, keywords):
+        """Return {keyword: (column, match type)} for every keyword that matches a column"""
+        matches = {}
+        for keyword in keywords:
+            column, match_type = self.match(keyword)
+            if column is not None:
+                matches[keyword] = (column, match_type)
+        return matches
@@ -0,0 +1,180 @@
+import copy
+import io
+import zipfile
+from pathlib import Path
+from lxml import etree
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from package import TemplatePackage
+from render_cache import link_or_copy
+
+# page: each row starts on a new page, section: each row is its own section
+MERGE_SEPARATORS = ('page', 'section')
+
+# Name of the merged documents, numbered when split into volumes
+MERGED_NAME = 'merged'
+
+DOCUMENT_PART = 'word/document.xml'
+
+# Marks where the rows go while the skeleton of document.xml is serialized
+_BODY_MARKER = 'merged rows'
+
+# w:pPr children that come before w:pageBreakBefore in the schema
+_BEFORE_PAGE_BREAK = (qn('w:pStyle'), qn('w:keepNext'), qn('w:keepLines'))
+
+_DOC_PR = '{http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}docPr'
+
+
+def document_xml(data):
+    """Return the parsed word/document.xml of a .docx held in memory"""
+    with zipfile.ZipFile(io.BytesIO(data)) as package:
+        return parse_xml(package.read(DOCUMENT_PART))
+
+
+class MergedDocument:
+    """
+    Rendered rows appended one after another into a single document, or into
+    volumes of volume_size rows. The first row of a volume is its base: styles,
+    numbering, headers and footers come from it, the body of every other row
+    is appended, separated by a page break or a section break.
+    Rows are kept as serialized XML until the volume is written.
+    """
+
+    def __init__(self, save_location, formats, separator='page', volume_size=0):
+        self.save_location = Path(save_location)
+        self.formats = formats
+        self.separator = separator
+        self.volume_size = volume_size
+        self.volume = 1
+        self.pending_pdfs = []  # .docx files of written volumes waiting for PDF conversion
+        self.written = []  # Output paths of every written volume
+        self._reset()
+
+    def _reset(self):
+        self._base = None  # Package of the first row of the volume
+        self._head = None
+        self._tail = None
+        self._section = None  # Section properties closing every row but the last
+        self._rows = []  # Serialized body content of each row
+        self._next_drawing_id = 1
+
+    def volume_name(self):
+        """File name of the volume being filled, without extension"""
+        if self.volume_size:
+            return f"{MERGED_NAME}_{self.volume:04d}"
+        return MERGED_NAME
+
+    def output_paths(self):
+        """Output paths of the volume being filled, one per format"""
+        return [str(self.save_location / format_type / f"{self.volume_name()}.{format_type}")
+                for format_type in self.formats]
+
+    def add(self, data):
+        """Append a rendered .docx (bytes), writing the volume once it is full"""
+        document = document_xml(data)
+        body = document.find(qn('w:body'))
+        body_section = body.find(qn('w:sectPr'))
+
+        if self._base is None:
+            self._start(data, document, body, body_section)
+
+        if body_section is not None:
+            body.remove(body_section)
+        self._renumber_drawings(body)
+        if self._rows:
+            self._separate(body)
+
+        # The body is serialized whole so namespaces are declared once, on its start tag
+        xml = etree.tostring(body, encoding='utf-8')
+        self._rows.append(xml[xml.index(b'>') + 1:xml.rindex(b'</')] if len(body) else b'')
+
+        if self.volume_size and len(self._rows) >= self.volume_size:
+            self.write_volume()
+
+    def _start(self, data, document, body, body_section):
+        """Take the package and document skeleton of a volume from its first row"""
+        self._base = TemplatePackage(io.BytesIO(data))
+
+        skeleton = copy.deepcopy(document)
+        skeleton_body = skeleton.find(qn('w:body'))
+        for child in list(skeleton_body):
+            skeleton_body.remove(child)
+        skeleton_body.append(etree.Comment(_BODY_MARKER))
+        if body_section is not None:
+            skeleton_body.append(copy.deepcopy(body_section))
+        xml = etree.tostring(skeleton, xml_declaration=True, encoding='UTF-8', standalone=True)
+        self._head, self._tail = xml.split(f'<!--{_BODY_MARKER}-->'.encode())
+
+        # Section breaks repeat the page setup of the document, always on a new page
+        if body_section is not None:
+            self._section = copy.deepcopy(body_section)
+        else:
+            self._section = etree.Element(qn('w:sectPr'))
+        section_type = self._section.find(qn('w:type'))
+        if section_type is not None:
+            self._section.remove(section_type)
+
+    def _renumber_drawings(self, body):
+        """Drawing ids must be unique in a document, every row repeats the template's"""
+        for doc_pr in body.iter(_DOC_PR):
+            doc_pr.set('id', str(self._next_drawing_id))
+            self._next_drawing_id += 1
+
+    def _separate(self, body):
+        """Start the row on a new page, or close the previous row's section"""
+        if self.separator == 'section':
+            # An empty paragraph holding the section properties ends the previous row
+            paragraph = etree.Element(qn('w:p'))
+            properties = etree.SubElement(paragraph, qn('w:pPr'))
+            properties.append(copy.deepcopy(self._section))
+            body.insert(0, paragraph)
+            return
+
+        first = body[0] if len(body) else None
+        if first is None or first.tag != qn('w:p'):
+            # Tables and empty rows get a paragraph to carry the break
+            first = etree.Element(qn('w:p'))
+            body.insert(0, first)
+        properties = first.find(qn('w:pPr'))
+        if properties is None:
+            properties = etree.Element(qn('w:pPr'))
+            first.insert(0, properties)
+        if properties.find(qn('w:pageBreakBefore')) is not None:
+            return
+        position = 0
+        while position < len(properties) and properties[position].tag in _BEFORE_PAGE_BREAK:
+            position += 1
+        properties.insert(position, etree.Element(qn('w:pageBreakBefore')))
+
+    def write_volume(self):
+        """Write the volume being filled in every format and start the next one"""
+        if self._base is None:
+            return
+        xml = self._head + b''.join(self._rows) + self._tail
+
+        docx_path = None
+        if "docx" in self.formats:
+            docx_path = self.save_location / "docx" / f"{self.volume_name()}.docx"
+            docx_path.parent.mkdir(parents=True, exist_ok=True)
+            docx_path.unlink(missing_ok=True)
+            self._base.write(docx_path, {DOCUMENT_PART: xml})
+
+        # Converted later next to its PDF target, like the documents of single rows
+        if "pdf" in self.formats:
+            pending_pdf = self.save_location / "pdf" / f"{self.volume_name()}.docx"
+            pending_pdf.parent.mkdir(parents=True, exist_ok=True)
+            if docx_path is not None:
+                link_or_copy(docx_path, pending_pdf)
+            else:
+                pending_pdf.unlink(missing_ok=True)
+                self._base.write(pending_pdf, {DOCUMENT_PART: xml})
+            self.pending_pdfs.append(str(pending_pdf))
+
+        self.written.append(self.output_paths())
+        self.volume += 1
+        self._reset()
+
+    def close(self):
+        """Write the last, partly filled volume"""
+        if self._rows:
+            self.write_volume()
@@ -0,0 +1,211 @@
+import json
+import os
+import sys
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the histogram buckets, as used by Prometheus clients
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prefix of every exported Prometheus metric
+PROMETHEUS_PREFIX = 'document_automation'
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+# Written in the save location after every run
+REPORT_NAME = 'render_report.json'
+
+
+def peak_rss_bytes(children=False):
+    """
+    Peak resident memory of this process (or of its finished child processes),
+    None when the platform does not report it.
+    """
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+    if children:
+        return None
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory = psutil.Process().memory_info()
+    # Windows keeps the peak working set, other platforms only the current value
+    return getattr(memory, 'peak_wset', memory.rss)
+
+
+class _Stage:
+    """Count, total, max and histogram of the durations of one stage"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)  # Last one is +Inf
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def merge(self, data):
+        self.count += data['count']
+        self.total += data['total']
+        self.max = max(self.max, data['max'])
+        self.buckets = [mine + theirs for mine, theirs in zip(self.buckets, data['buckets'])]
+
+    def to_dict(self):
+        return {'count': self.count, 'total': self.total, 'max': self.max, 'buckets': self.buckets}
+
+
+class RunMetrics:
+    """
+    Timings per stage and counters of a run. Worker processes keep their own
+    RunMetrics and send take() results back to be merged into the job's.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def time(self, stage):
+        """Time the body of a with block as one observation of a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        if stage not in self.stages:
+            self.stages[stage] = _Stage()
+        self.stages[stage].observe(seconds)
+
+    def count(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def take(self):
+        """Return the raw data gathered so far and start over, used by workers"""
+        data = {
+            'stages': {name: stage.to_dict() for name, stage in self.stages.items()},
+            'counters': self.counters,
+        }
+        self.stages = {}
+        self.counters = {}
+        return data
+
+    def merge(self, data):
+        """Add the data returned by take() in another process"""
+        for name, stage_data in data['stages'].items():
+            if name not in self.stages:
+                self.stages[name] = _Stage()
+            self.stages[name].merge(stage_data)
+        for counter, amount in data['counters'].items():
+            self.count(counter, amount)
+
+    def report(self):
+        """JSON friendly report of the run"""
+        stages = {}
+        for name, stage in self.stages.items():
+            cumulative = 0
+            histogram = {}
+            for bound, bucket_count in zip(BUCKETS + ('+Inf',), stage.buckets):
+                cumulative += bucket_count
+                histogram[str(bound)] = cumulative
+            stages[name] = {
+                'count': stage.count,
+                'total_seconds': round(stage.total, 6),
+                'mean_seconds': round(stage.total / stage.count, 6) if stage.count else 0.0,
+                'max_seconds': round(stage.max, 6),
+                'histogram': histogram,  # Cumulative, keyed by bucket upper bound
+            }
+        return {
+            'elapsed_seconds': round(time.perf_counter() - self.started, 6),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'peak_rss_children_bytes': peak_rss_bytes(children=True),
+            'stages': stages,
+            'counters': dict(self.counters),
+        }
+
+    def write_json(self, path, report=None):
+        """Write the run report as JSON"""
+        with open(path, 'w', encoding='utf-8') as report_file:
+            json.dump(report or self.report(), report_file, indent=2)
+
+    def write_prometheus(self, path, report=None):
+        """
+        Write the run report in the Prometheus text format, for the textfile
+        collector of node_exporter. The file is replaced atomically.
+        """
+        report = report or self.report()
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Time spent per stage of the last run",
+            f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds histogram",
+        ]
+        for name, stage in report['stages'].items():
+            for bound, cumulative in stage['histogram'].items():
+                lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_sum{{stage="{name}"}} {stage["total_seconds"]}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+
+        for counter, amount in report['counters'].items():
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{counter}_total counter")
+            lines.append(f"{PROMETHEUS_PREFIX}_{counter}_total {amount}")
+
+        gauges = [('elapsed_seconds', report['elapsed_seconds']),
+                  ('peak_rss_bytes', report['peak_rss_bytes']),
+                  ('peak_rss_children_bytes', report['peak_rss_children_bytes'])]
+        for gauge, value in gauges:
+            if value is not None:
+                lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{gauge} gauge")
+                lines.append(f"{PROMETHEUS_PREFIX}_{gauge} {value}")
+
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write('\n'.join(lines) + '\n')
+        os.replace(temporary_path, path)
+
+
+@contextmanager
+def profiled(profiler, output_path):
+    """
+    Profile the body of a with block with cProfile (.prof file, for pstats or
+    snakeviz) or pyinstrument (.html file). Only the calling process is
+    profiled, use a single worker to include the rendering itself.
+    """
+    if profiler == 'cprofile':
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(output_path)
+    elif profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise RuntimeError("pyinstrument is not installed. Install it with: pip install pyinstrument")
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            with open(output_path, 'w', encoding='utf-8') as profile_file:
+                profile_file.write(profile.output_html())
+    else:
+        yield
@@ -0,0 +1,129 @@
+import io
+import struct
+import zipfile
+import zlib
+
+# ZIP record layouts, see APPNOTE.TXT sections 4.3.7, 4.3.12 and 4.3.16
+_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+_CENTRAL_HEADER = struct.Struct('<4s4B4HL2L5H2L')
+_END_RECORD = struct.Struct('<4s4H2LH')
+_LOCAL_SIGNATURE = b'PK\x03\x04'
+_CENTRAL_SIGNATURE = b'PK\x01\x02'
+_END_SIGNATURE = b'PK\x05\x06'
+
+# General purpose flag for sizes stored after the data, never used when writing
+_DATA_DESCRIPTOR_FLAG = 0x08
+_UTF8_FLAG = 0x800
+
+
+class _Member:
+    """One stored ZIP member, ready to be written as is"""
+
+    def __init__(self, filename, date_time, compress_type, crc, compress_size, file_size,
+                 flag_bits, external_attr, data):
+        self.filename = filename
+        self.date_time = date_time
+        self.compress_type = compress_type
+        self.crc = crc
+        self.compress_size = compress_size
+        self.file_size = file_size
+        self.flag_bits = flag_bits & ~_DATA_DESCRIPTOR_FLAG
+        self.external_attr = external_attr
+        self.data = data  # Compressed bytes
+
+    def dos_date_time(self):
+        year, month, day, hour, minute, second = self.date_time
+        dos_date = (max(year, 1980) - 1980) << 9 | month << 5 | day
+        dos_time = hour << 11 | minute << 5 | second // 2
+        return dos_date, dos_time
+
+
+class TemplatePackage:
+    """
+    The template .docx read once, with every member kept as its compressed
+    bytes. Writing a rendered document copies the unchanged members (media,
+    fonts, styles) without recompressing them and only deflates the parts
+    that were changed.
+    """
+
+    def __init__(self, template_path):
+        self.template_path = template_path
+        self.members = []
+        # A path, or a binary file object such as a rendered document in memory
+        source = template_path if hasattr(template_path, 'read') else open(template_path, 'rb')
+        with source as template_file, zipfile.ZipFile(template_file) as package:
+            for info in package.infolist():
+                template_file.seek(info.header_offset)
+                header = _LOCAL_HEADER.unpack(template_file.read(_LOCAL_HEADER.size))
+                # The local header has its own name and extra field lengths
+                template_file.seek(header[10] + header[11], 1)
+                self.members.append(_Member(
+                    info.filename, info.date_time, info.compress_type, info.CRC,
+                    info.compress_size, info.file_size, info.flag_bits,
+                    info.external_attr, template_file.read(info.compress_size)))
+
+    def write(self, target, changed_parts):
+        """
+        Write the package to a path or binary file object, replacing the
+        members named in changed_parts ({name: uncompressed bytes}).
+        """
+        if hasattr(target, 'write'):
+            self._write_members(target, changed_parts)
+        else:
+            with open(target, 'wb') as target_file:
+                self._write_members(target_file, changed_parts)
+
+    def _write_members(self, target_file, changed_parts):
+        central_directory = []
+        offset = 0
+        for member in self.members:
+            if member.filename in changed_parts:
+                member = self._deflate(member, changed_parts[member.filename])
+
+            name = member.filename.encode('utf-8')
+            flag_bits = member.flag_bits | (_UTF8_FLAG if not member.filename.isascii() else 0)
+            dos_date, dos_time = member.dos_date_time()
+
+            target_file.write(_LOCAL_HEADER.pack(
+                _LOCAL_SIGNATURE, 20, 0, flag_bits, member.compress_type, dos_time, dos_date,
+                member.crc, member.compress_size, member.file_size, len(name), 0))
+            target_file.write(name)
+            target_file.write(member.data)
+
+            central_directory.append(_CENTRAL_HEADER.pack(
+                _CENTRAL_SIGNATURE, 20, 0, 20, 0, flag_bits, member.compress_type,
+                dos_time, dos_date, member.crc, member.compress_size, member.file_size,
+                len(name), 0, 0, 0, 0, member.external_attr, offset) + name)
+            offset += _LOCAL_HEADER.size + len(name) + member.compress_size
+
+        directory = b''.join(central_directory)
+        target_file.write(directory)
+        target_file.write(_END_RECORD.pack(
+            _END_SIGNATURE, 0, 0, len(central_directory), len(central_directory),
+            len(directory), offset, 0))
+
+    def _deflate(self, member, data):
+        """Compress new content for a member"""
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        return _Member(
+            member.filename, member.date_time, zipfile.ZIP_DEFLATED, zlib.crc32(data),
+            len(compressed), len(data), member.flag_bits, member.external_attr, compressed)
+
+
+class RenderedPackage:
+    """A rendered document: the template package plus the parts that changed"""
+
+    def __init__(self, package, changed_parts):
+        self.package = package
+        self.changed_parts = changed_parts
+
+    def save(self, path):
+        """Write the .docx package, same call as Document.save"""
+        self.package.write(path, self.changed_parts)
+
+    def to_bytes(self):
+        """Serialize the .docx package into memory"""
+        buffer = io.BytesIO()
+        self.package.write(buffer, self.changed_parts)
+        return buffer.getvalue()
@@ -0,0 +1,111 @@
+import datetime
+import math
+import numpy as np
+import pandas as pd
+from pandas.api.types import (
+    infer_dtype, is_bool_dtype, is_datetime64_any_dtype, is_float_dtype, is_integer_dtype)
+
+# Anything but letters, digits, space, - and _ is dropped from file and folder names
+_UNSAFE_NAME_CHARS = r'[^\w \-]'
+
+# Floats past this cannot hold every integer exactly, they keep their float text
+_MAX_EXACT_FLOAT = 2 ** 53
+
+DATE_FORMAT = '%Y-%m-%d'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def format_value(value):
+    """
+    Text of a single cell: empty for missing values, whole numbers without
+    a trailing .0 and dates without a midnight time.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, float):
+        if math.isnan(value):
+            return ''
+        if value.is_integer() and abs(value) < _MAX_EXACT_FLOAT:
+            return str(int(value))
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        if pd.isna(value):
+            return ''
+        if value.time() == datetime.time():
+            return value.strftime(DATE_FORMAT)
+        return value.strftime(DATETIME_FORMAT)
+    return str(value)
+
+
+def format_column(series):
+    """Convert a whole column to text at once, with the rules of format_value"""
+    if is_bool_dtype(series) or is_integer_dtype(series):
+        return [str(value) for value in series.tolist()]
+
+    if is_float_dtype(series):
+        values = series.to_numpy(dtype=float)
+        text = values.astype(str).astype(object)
+        whole = np.isfinite(values) & (np.floor(values) == values) & (np.abs(values) < _MAX_EXACT_FLOAT)
+        text[whole] = values[whole].astype(np.int64).astype(str).tolist()
+        text[np.isnan(values)] = ''
+        return text.tolist()
+
+    if is_datetime64_any_dtype(series):
+        text = np.where(
+            series.dt.normalize() == series,
+            series.dt.strftime(DATE_FORMAT), series.dt.strftime(DATETIME_FORMAT)).astype(object)
+        text[series.isna().to_numpy()] = ''
+        return text.tolist()
+
+    # Text columns only need their missing values replaced
+    if infer_dtype(series, skipna=True) in ('string', 'empty'):
+        return series.astype(object).where(series.notna(), '').tolist()
+
+    # Mixed columns, as read from Excel cells of different types
+    return [format_value(value) for value in series.tolist()]
+
+
+def clean_names(names):
+    """Keep only characters that are safe in file and folder names"""
+    return pd.Series(names, dtype=object).str.replace(_UNSAFE_NAME_CHARS, '', regex=True).tolist()
+
+
+def prepare_chunk(chunk, start, mapping, name_column, folder_column):
+    """
+    Turn a DataFrame chunk into (index, output_name, folder_name, values)
+    tuples, values being the text of the mapped columns in mapping order.
+    Every column is converted once, whatever the number of placeholders.
+    """
+    text = {column: format_column(chunk[column]) for column in chunk.columns}
+    row_count = len(chunk)
+
+    # Output names come from the name column, empty names get a numbered default
+    output_names = clean_names([name.strip() for name in text[name_column]])
+    for position, output_name in enumerate(output_names):
+        if not output_name:
+            output_names[position] = f"document_{start + position + 1}"
+
+    # Custom folder names, or default when there is no folder column or value
+    if folder_column:
+        folder_names = [folder_name or "default" for folder_name in clean_names(text[folder_column])]
+    else:
+        folder_names = ["default"] * row_count
+
+    if mapping:
+        values = zip(*(text[column] for column in mapping.values()))
+    else:
+        values = [()] * row_count
+
+    return zip(range(start, start + row_count), output_names, folder_names, values)
+
+
+def prepare_rows(chunks, mapping, name_column, folder_column, start=0):
+    """
+    Prepare every chunk of a data source, yielding one tuple per row. start is
+    the index of the first row, when the chunks begin further down the file.
+    """
+    for chunk in chunks:
+        yield from prepare_chunk(chunk, start, mapping, name_column, folder_column)
+        start += len(chunk)
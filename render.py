@@ -0,0 +1,226 @@
+import copy
+import re
+from lxml import etree
+from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.oxml import serialize_part_xml
+from docx.opc.part import XmlPart
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import qn
+from docx.shared import Pt, RGBColor
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+from package import RenderedPackage, TemplatePackage
+
+# Parts other than the main document that hold paragraphs of text
+STORY_CONTENT_TYPES = (CT.WML_HEADER, CT.WML_FOOTER, CT.WML_FOOTNOTES, CT.WML_ENDNOTES)
+
+
+def story_parts(document):
+    """
+    Return (part name, root element) for every part holding document text:
+    the main document (body, tables at any depth, text boxes), headers,
+    footers, footnotes and endnotes.
+    """
+    stories = [(document.part.partname.lstrip('/'), document.element)]
+    for part in document.part.package.iter_parts():
+        if part.content_type in STORY_CONTENT_TYPES:
+            element = part.element if isinstance(part, XmlPart) else parse_xml(part.blob)
+            stories.append((part.partname.lstrip('/'), element))
+    return stories
+
+
+def keyword_placeholders(keyword, keyword_symbols):
+    """Return the placeholder strings (keyword wrapped in its symbols) for a keyword"""
+    placeholders = []
+    for start_symbol, end_symbol in keyword_symbols.get(keyword, []):
+        if end_symbol:
+            placeholders.append(start_symbol + keyword + end_symbol)
+        else:
+            placeholders.append(start_symbol + keyword)
+    return placeholders
+
+
+def row_values(values, mapping):
+    """Pair the prepared values of a row (in mapping order) with their keywords"""
+    return dict(zip(mapping, values))
+
+
+class KeywordMatcher:
+    """
+    Every placeholder of a job compiled into a single pattern, built once from
+    the mapping so each run's text is scanned once per row.
+    """
+
+    def __init__(self, mapping, keyword_symbols):
+        # Placeholder string -> keyword, duplicate symbol pairs collapse here
+        self.keywords = {}
+        for keyword in mapping:
+            for placeholder in keyword_placeholders(keyword, keyword_symbols):
+                self.keywords.setdefault(placeholder, keyword)
+
+        # Longest placeholders first so {{1}} wins over {1} at the same position
+        placeholders = sorted(self.keywords, key=len, reverse=True)
+        self.pattern = re.compile(
+            '|'.join(re.escape(placeholder) for placeholder in placeholders)) if placeholders else None
+
+    def search(self, text):
+        """Check if text holds any placeholder"""
+        return self.pattern is not None and self.pattern.search(text) is not None
+
+    def replace(self, text, values):
+        """
+        Replace every placeholder in text in one pass.
+        Returns the new text and the keywords that were replaced.
+        """
+        parts = []
+        found = []
+        last = 0
+        for match in self.pattern.finditer(text):
+            keyword = self.keywords[match.group()]
+            parts.append(text[last:match.start()])
+            parts.append(values[keyword])
+            found.append(keyword)
+            last = match.end()
+        if not found:
+            return text, found
+        parts.append(text[last:])
+        return ''.join(parts), found
+
+
+def apply_keyword_format(run, format_settings):
+    """Apply the format settings of a keyword to a run"""
+    run.font.name = format_settings['font_name']
+    run.font.size = Pt(format_settings['font_size'])
+    run.font.color.rgb = RGBColor.from_string(format_settings['font_color'][1:])
+    run.font.bold = format_settings['bold']
+    run.font.italic = format_settings['italic']
+    run.font.underline = format_settings['underline']
+
+
+class KeywordFormats:
+    """
+    Keyword formats of a job compiled into ready w:rPr fragments. The formatted
+    properties of each distinct (run properties, keywords) pair are built once
+    with apply_keyword_format, later runs with the same properties (the same
+    template run on every row) only get a copy of the fragment.
+    """
+
+    def __init__(self, keyword_formats=None):
+        self.keyword_formats = keyword_formats or {}
+        # (w:rPr XML of the run, keywords) -> formatted w:rPr
+        self.fragments = {}
+        # Compiled up front for runs without properties, invalid formats fail here
+        for keyword in self.keyword_formats:
+            self._fragment(None, (keyword,))
+
+    def apply(self, run, keywords):
+        """Give a run the formats of the keywords it holds, in order"""
+        keywords = tuple(keyword for keyword in keywords if keyword in self.keyword_formats)
+        if not keywords:
+            return
+        r = run._r
+        properties = r.rPr
+        fragment = self._fragment(properties, keywords)
+        if properties is not None:
+            r.remove(properties)
+        # w:rPr is always the first child of a run
+        r.insert(0, copy.deepcopy(fragment))
+
+    def _fragment(self, properties, keywords):
+        key = (etree.tostring(properties) if properties is not None else b'', keywords)
+        fragment = self.fragments.get(key)
+        if fragment is None:
+            scratch = OxmlElement('w:r')
+            if properties is not None:
+                scratch.append(copy.deepcopy(properties))
+            scratch_run = Run(scratch, None)
+            for keyword in keywords:
+                apply_keyword_format(scratch_run, self.keyword_formats[keyword])
+            fragment = self.fragments[key] = scratch.rPr
+        return fragment
+
+
+def replace_keywords_in_paragraph(paragraph, values, matcher, formats):
+    """Replace keywords in a paragraph, formats being the job's KeywordFormats"""
+    for run in paragraph.runs:
+        new_text, found = matcher.replace(run.text, values)
+        if not found:
+            continue
+
+        # Apply formatting if specified
+        formats.apply(run, found)
+
+        # Replace text
+        run.text = new_text
+
+
+class CompiledTemplate:
+    """
+    Template parsed once, with the location of every mapped placeholder recorded.
+    Each render only clones and rewrites the paragraphs holding placeholders,
+    the rest of the document is shared between rows.
+    """
+
+    def __init__(self, template_path, mapping, keyword_symbols, keyword_formats=None):
+        self.template_path = template_path
+        self.mapping = mapping
+        self.keyword_symbols = keyword_symbols
+        self.keyword_formats = keyword_formats or {}
+        self.formats = KeywordFormats(self.keyword_formats)
+        self.matcher = KeywordMatcher(mapping, keyword_symbols)
+        self.document = Document(template_path)
+        self.package = TemplatePackage(template_path)
+        # (part name, root element) of the parts holding placeholders
+        self.stories = []
+        # Each slot is [live element, pristine copy, paragraph indices to process]
+        self.slots = []
+        self._compile()
+
+    def _compile(self):
+        """Record every paragraph (body, tables, text boxes, headers, footers, notes) holding a placeholder"""
+        if self.matcher.pattern is None:
+            return
+
+        for partname, element in story_parts(self.document):
+            slot_count = len(self.slots)
+            slots_by_root = {}
+            for p in element.iter(qn('w:p')):
+                if not self.matcher.search(Paragraph(p, None).text):
+                    continue
+
+                # Text box paragraphs live inside another paragraph, so the outermost
+                # paragraph is the unit that gets cloned for each row
+                root = p
+                for ancestor in p.iterancestors(qn('w:p')):
+                    root = ancestor
+                if root not in slots_by_root:
+                    slots_by_root[root] = [root, copy.deepcopy(root), []]
+                    self.slots.append(slots_by_root[root])
+                slot = slots_by_root[root]
+                slot[2].append(list(root.iter(qn('w:p'))).index(p))
+
+            if len(self.slots) > slot_count:
+                self.stories.append((partname, element))
+
+    def render(self, values):
+        """
+        Fill the template with the prepared values of one row and return the rendered
+        package. Only the parts holding placeholders are serialized, the other
+        members of the template are copied as they are when the package is saved.
+        """
+        values = row_values(values, self.mapping)
+
+        for slot in self.slots:
+            live, pristine, indices = slot
+            clone = copy.deepcopy(pristine)
+            live.getparent().replace(live, clone)
+            slot[0] = clone
+
+            paragraphs = list(clone.iter(qn('w:p')))
+            for index in indices:
+                replace_keywords_in_paragraph(
+                    Paragraph(paragraphs[index], None), values, self.matcher, self.formats)
+
+        return RenderedPackage(self.package, {
+            partname: serialize_part_xml(element) for partname, element in self.stories})
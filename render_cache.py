@@ -0,0 +1,88 @@
+import os
+import shutil
+from pathlib import Path
+from manifest import content_hash
+
+
+def link_or_copy(source, target, data=None):
+    """
+    Hardlink target to source, or copy it where links are not supported. data
+    is the content of source when the caller still holds it in memory, it is
+    written instead of copying the file, or on its own when source is None.
+    """
+    target = Path(target)
+    if source is not None and Path(source) == target:
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # The target may be a link shared with other rows, it must not be written through
+    target.unlink(missing_ok=True)
+    if source is not None:
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            pass  # Links are not supported across volumes or on some shares
+    if data is not None:
+        target.write_bytes(data)
+    else:
+        shutil.copyfile(source, target)
+
+
+class RenderCache:
+    """
+    Rows whose mapped values are identical render to identical documents, only
+    the name and folder columns differ. The first row with a given content key
+    is rendered (and converted) as usual, the later ones are linked to its
+    outputs once the run is done.
+    One entry is kept per distinct row, so it holds only the raw content digest
+    and the row index. The outputs of the rows that have duplicates are read
+    back from the job manifest, those of the duplicates are rebuilt with
+    output_paths(folder_name, output_name).
+    """
+
+    def __init__(self, job_digest, output_paths):
+        self.job_digest = job_digest
+        self.output_paths = output_paths
+        self.sources = {}  # Content digest -> index of the first row
+        self.duplicates = []  # (index, output_name, folder_name, row digest bytes, source index)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, index, values, output_name, folder_name, row_digest):
+        """
+        Return True if a row with the same content was already rendered, the
+        row is then kept as a duplicate instead of being rendered.
+        """
+        key = content_hash(values, self.job_digest)
+        source_index = self.sources.get(key)
+        if source_index is None:
+            self.sources[key] = index
+            self.misses += 1
+            return False
+        self.duplicates.append((index, output_name, folder_name, bytes.fromhex(row_digest), source_index))
+        self.hits += 1
+        return True
+
+    def source_indices(self):
+        """Indices of the rendered rows that have duplicates"""
+        return {duplicate[4] for duplicate in self.duplicates}
+
+    def copy_duplicates(self, failed_rows, source_outputs):
+        """
+        Link every duplicate to the outputs of its source row, source_outputs
+        mapping the index of each source to its output paths. failed_rows maps
+        the index of each failed row to its error, duplicates of a failed row
+        fail the same way. Yields (index, output_name, row_digest, outputs, error).
+        """
+        for index, output_name, folder_name, row_digest, source_index in self.duplicates:
+            outputs = self.output_paths(folder_name, output_name)
+            error = failed_rows.get(source_index)
+            if not error and source_index not in source_outputs:
+                error = "The identical row it copies was not rendered"
+            if not error:
+                try:
+                    for source, target in zip(source_outputs[source_index], outputs):
+                        link_or_copy(source, target)
+                except OSError as copy_error:
+                    error = str(copy_error)
+            yield index, output_name, row_digest.hex(), outputs, error
@@ -0,0 +1,538 @@
+"""
+Sharded rendering through a shared queue directory, for runs too large for
+one machine. The coordinator splits the list file into row-range shards,
+workers on any number of hosts claim shards until none are left, and the
+coordinator merges the shard manifests and summaries.
+
+Example:
+    python shards.py init --queue /mnt/shared/queue --template letter.docx \
+        --list data.csv --config job.json --output-dir /mnt/shared/out --shard-size 5000
+    python shards.py work --queue /mnt/shared/queue --workers 8      (on every host)
+    python shards.py merge --queue /mnt/shared/queue --wait
+
+    python shards.py local --template letter.docx --list data.csv \
+        --config job.json --output-dir out --processes 4
+
+local runs the whole pipeline on one machine with worker processes and a
+temporary queue directory. The template, list file and output directory
+must be reachable under the same paths from every host.
+
+A shard is claimed by creating its lock file with O_EXCL, which only one
+worker can do, and the lock records the worker's id. A background thread
+touches the lock for as long as the shard runs, PDF conversion included; a
+claim left untouched for --stale-after seconds (a crashed worker) is taken
+over and the shard resumes from its manifest. A worker that finds its lock
+owned by someone else cancels the shard and leaves it to the new owner.
+
+merge prints a JSON summary; the exit code is 0 when every row succeeded,
+1 when some rows or shards failed and 2 when the queue could not be merged.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import get_context
+from pathlib import Path
+from batch import RENDER_ENGINES
+from converters import CONVERTERS
+from data_source import open_data_source
+from engine import OUTPUT_FORMATS, JobError, RenderJob, detect_template_keywords
+from manifest import MANIFEST_NAME, file_hash
+
+JOB_FILE = 'job.json'
+
+# Rows per shard unless told otherwise
+DEFAULT_SHARD_SIZE = 5000
+
+# Seconds without a touch of the lock file before a claim counts as abandoned
+DEFAULT_STALE_AFTER = 600
+
+# Seconds between touches of the lock file while a shard renders
+HEARTBEAT_INTERVAL = 10
+
+# Seconds between checks of the queue while merge waits for the workers
+POLL_INTERVAL = 5
+
+# Written in the save location once the shards are merged
+SUMMARY_NAME = 'render_summary.json'
+
+
+def write_json_atomic(path, data):
+    """Write a JSON file so readers never see it half written"""
+    path = Path(path)
+    temporary_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(temporary_path, 'w', encoding='utf-8') as json_file:
+        json.dump(data, json_file, indent=2)
+    os.replace(temporary_path, path)
+
+
+def worker_name():
+    """Identify a worker process across hosts"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class ShardQueue:
+    """
+    Queue directory shared by the coordinator and the workers:
+        job.json            settings of the job
+        shards/N.json       row range of every shard
+        claims/N.lock       worker holding a shard
+        done/N.json         summary of a finished shard
+        manifests/N.jsonl   job manifest of a shard
+    Run reports go to the save location as render_report.N.json, next to the
+    outputs, since the queue may be temporary.
+    """
+
+    def __init__(self, queue_dir):
+        self.path = Path(queue_dir)
+
+    def _file(self, folder, shard, suffix):
+        return self.path / folder / f"{shard:05d}{suffix}"
+
+    def create(self, job, shard_size):
+        """Split the list file into shards of shard_size rows and write the queue"""
+        if (self.path / JOB_FILE).exists():
+            raise JobError(f"The queue directory already holds a job: {self.path}")
+        if shard_size < 1:
+            raise JobError("The shard size must be at least 1")
+
+        # The count only decides the shard boundaries, the last shard runs to
+        # the end of the file in case the estimate is short
+        source = open_data_source(job['list'])
+        rows = source.count_rows()
+        starts = list(range(0, rows, shard_size)) or [0]
+
+        # CSV shards seek to the byte offset of their first row. Without one a
+        # shard parses every row before its range, so the total work grows
+        # with the square of the number of shards
+        offsets = source.row_offsets(starts)
+        unseekable = sum(1 for start, offset in zip(starts, offsets) if start and offset is None)
+        if source.is_excel and len(starts) > 1:
+            print(f"Warning: every shard of an Excel list file reads the sheet from the top, "
+                  f"convert {job['list']} to CSV for large sharded runs", file=sys.stderr)
+        elif unseekable:
+            print(f"Warning: {unseekable} shards read the list file from the top, "
+                  f"quoted values span several lines before their rows", file=sys.stderr)
+
+        for folder in ('shards', 'claims', 'done', 'manifests'):
+            (self.path / folder).mkdir(parents=True, exist_ok=True)
+        for shard, start in enumerate(starts):
+            stop = start + shard_size if shard < len(starts) - 1 else None
+            write_json_atomic(self._file('shards', shard, '.json'),
+                              {'shard': shard, 'start': start, 'stop': stop, 'offset': offsets[shard]})
+        # Written last, workers only start once every shard exists
+        write_json_atomic(self.path / JOB_FILE, dict(job, rows=rows, shards=len(starts)))
+        return len(starts)
+
+    def job(self):
+        """Settings of the job, None while the queue is not ready"""
+        try:
+            with open(self.path / JOB_FILE, encoding='utf-8') as job_file:
+                return json.load(job_file)
+        except FileNotFoundError:
+            return None
+
+    def shard(self, shard):
+        with open(self._file('shards', shard, '.json'), encoding='utf-8') as shard_file:
+            return json.load(shard_file)
+
+    def is_done(self, shard):
+        return self._file('done', shard, '.json').exists()
+
+    def claim(self, worker, stale_after=DEFAULT_STALE_AFTER):
+        """
+        Claim the first shard that is neither done nor held by a live worker.
+        Returns (shard, taken_over) or (None, False) when nothing is left.
+        """
+        for shard in range(self.job()['shards']):
+            if self.is_done(shard):
+                continue
+            lock_path = self._file('claims', shard, '.lock')
+            taken_over = False
+            if lock_path.exists() and self._is_stale(lock_path, stale_after):
+                # Renaming succeeds for one worker only, the others see the lock gone
+                abandoned_path = lock_path.with_name(f"{lock_path.name}.{worker}.stale")
+                try:
+                    os.rename(lock_path, abandoned_path)
+                except FileNotFoundError:
+                    continue
+                if not self._is_stale(abandoned_path, stale_after):
+                    # Another worker took the shard over between the check and
+                    # the rename, its fresh lock goes back unless a third one
+                    # has claimed the shard meanwhile
+                    try:
+                        os.link(abandoned_path, lock_path)
+                    except FileExistsError:
+                        pass
+                    abandoned_path.unlink()
+                    continue
+                abandoned_path.unlink()
+                taken_over = True
+            try:
+                descriptor = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as lock_file:
+                json.dump({'worker': worker, 'claimed_at': time.time()}, lock_file)
+            # Finished between the done check and the claim
+            if self.is_done(shard):
+                lock_path.unlink(missing_ok=True)
+                continue
+            return shard, taken_over
+        return None, False
+
+    def _is_stale(self, lock_path, stale_after):
+        try:
+            return time.time() - lock_path.stat().st_mtime > stale_after
+        except FileNotFoundError:
+            return False
+
+    def owner(self, shard):
+        """Worker holding the claim on a shard, None when it is not claimed"""
+        try:
+            with open(self._file('claims', shard, '.lock'), encoding='utf-8') as lock_file:
+                return json.load(lock_file).get('worker')
+        except (FileNotFoundError, ValueError):
+            # Missing, or created but not written yet
+            return None
+
+    def heartbeat(self, shard, worker):
+        """Show the claim is still alive, False when the worker no longer holds it"""
+        if self.owner(shard) != worker:
+            return False
+        try:
+            os.utime(self._file('claims', shard, '.lock'))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def complete(self, shard, worker, summary):
+        """
+        Record the summary of a finished shard and release its claim. Returns
+        False without touching anything when the claim was taken over.
+        """
+        if self.owner(shard) != worker:
+            return False
+        write_json_atomic(self._file('done', shard, '.json'), summary)
+        self._file('claims', shard, '.lock').unlink(missing_ok=True)
+        return True
+
+    def status(self):
+        """Count the shards done, claimed and waiting"""
+        total = self.job()['shards']
+        done = sum(1 for shard in range(total) if self.is_done(shard))
+        claimed = sum(1 for shard in range(total)
+                      if not self.is_done(shard) and self._file('claims', shard, '.lock').exists())
+        return {'shards': total, 'done': done, 'claimed': claimed, 'waiting': total - done - claimed}
+
+    def run_shard(self, shard, worker, workers=1, progress=None):
+        """
+        Render the rows of one shard and return its summary. A background
+        thread keeps the claim alive every HEARTBEAT_INTERVAL seconds and
+        cancels the job once the claim belongs to another worker.
+        """
+        job = self.job()
+        shard_info = self.shard(shard)
+        if file_hash(job['template']) != job['template_hash']:
+            raise JobError("The template changed since the queue was created")
+
+        manifest_path = self._file('manifests', shard, '.jsonl')
+        render_job = RenderJob(
+            job['template'], job['list'], job['mapping'], job['keyword_symbols'],
+            job['save_location'],
+            formats=job['formats'],
+            keyword_formats=job['keyword_formats'],
+            workers=workers,
+            converter=job['converter'],
+            render_engine=job['render_engine'],
+            # A shard taken over from a crashed worker skips the rows already done
+            run_mode='resume' if manifest_path.exists() else 'all',
+            dedupe=job['dedupe'],
+            row_range=(shard_info['start'], shard_info['stop']),
+            row_offset=shard_info.get('offset'),
+            manifest_path=manifest_path,
+            report_path=Path(job['save_location']) / f"render_report.{shard:05d}.json",
+        )
+
+        stop = threading.Event()
+
+        def keep_claim():
+            while not stop.wait(HEARTBEAT_INTERVAL):
+                if not self.heartbeat(shard, worker):
+                    render_job.cancel()
+                    return
+
+        heartbeat = threading.Thread(target=keep_claim, daemon=True)
+        heartbeat.start()
+        try:
+            summary = render_job.run(progress)
+        finally:
+            stop.set()
+            heartbeat.join()
+        summary['shard'] = shard
+        summary['worker'] = worker
+        summary['rows'] = [shard_info['start'], shard_info['stop']]
+        return summary
+
+
+def create_job(queue_dir, template_path, list_path, config, save_location, formats=OUTPUT_FORMATS,
+               converter=None, render_engine='docx', dedupe=True, shard_size=DEFAULT_SHARD_SIZE):
+    """Coordinator side: write the job and its shards into the queue directory"""
+    mapping = config.get('mapping')
+    if not mapping:
+        raise JobError("The config file has no keyword mapping")
+    _, keyword_symbols = detect_template_keywords(template_path)
+    job = {
+        'template': os.path.abspath(template_path),
+        'template_hash': file_hash(template_path),
+        'list': os.path.abspath(list_path),
+        'mapping': mapping,
+        'keyword_symbols': keyword_symbols,
+        'keyword_formats': config.get('keyword_formats', {}),
+        'save_location': os.path.abspath(save_location),
+        'formats': [format_type for format_type in OUTPUT_FORMATS if format_type in formats],
+        'converter': converter,
+        'render_engine': render_engine,
+        'dedupe': dedupe,
+        'shard_size': shard_size,
+    }
+    return ShardQueue(queue_dir).create(job, shard_size)
+
+
+def work(queue_dir, workers=1, stale_after=DEFAULT_STALE_AFTER, worker=None):
+    """
+    Worker side: claim and render shards until none are left. A shard whose
+    job fails is completed with the error so the coordinator can report it.
+    Returns the numbers of the shards this worker finished.
+    """
+    queue = ShardQueue(queue_dir)
+    worker = worker or worker_name()
+    if queue.job() is None:
+        raise JobError(f"No job in the queue directory: {queue_dir}")
+
+    finished = []
+    while True:
+        shard, taken_over = queue.claim(worker, stale_after)
+        if shard is None:
+            return finished
+        if taken_over:
+            print(f"Warning: {worker} took over abandoned shard {shard}", file=sys.stderr)
+
+        try:
+            summary = queue.run_shard(shard, worker, workers)
+        except Exception as shard_error:
+            summary = {'shard': shard, 'worker': worker, 'error': str(shard_error)}
+        if not queue.complete(shard, worker, summary):
+            print(f"Warning: {worker} lost shard {shard} to another worker", file=sys.stderr)
+            continue
+        finished.append(shard)
+
+
+def manifest_rows(manifest_path):
+    """
+    Final outcome of every row recorded in a shard manifest, as
+    {index: (name, error)} with error None for rows that succeeded. The last
+    line of a row wins, so rows a crashed worker finished before its shard
+    was taken over count as they ended.
+    """
+    rows = {}
+    if not manifest_path.exists():
+        return rows
+    with open(manifest_path, encoding='utf-8') as manifest_file:
+        for line in manifest_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Line cut short by a crash
+            if entry.get('type') == 'row':
+                rows[entry['index']] = (entry['name'], entry['error'] if entry['status'] != 'ok' else None)
+    return rows
+
+
+def merge(queue_dir, wait=False, poll_interval=POLL_INTERVAL):
+    """
+    Coordinator side: combine the shard manifests into one summary and into
+    the save location's manifest, so later runs can resume from it. Row
+    counts come from the last manifest line of every row, the done files only
+    add shard errors, cache counters and reports. With wait, block until
+    every shard is done.
+    """
+    queue = ShardQueue(queue_dir)
+    job = queue.job()
+    if job is None:
+        raise JobError(f"No job in the queue directory: {queue_dir}")
+
+    while True:
+        status = queue.status()
+        if status['done'] == status['shards']:
+            break
+        if not wait:
+            raise JobError(
+                f"{status['shards'] - status['done']} of {status['shards']} shards are not done yet")
+        time.sleep(poll_interval)
+
+    summary = {
+        'total': 0,
+        'successful': 0,
+        'failed': [],
+        'cache_hits': 0,
+        'cache_misses': 0,
+        'save_location': job['save_location'],
+        'formats': job['formats'],
+        'shards': job['shards'],
+        'failed_shards': [],
+        'workers': [],
+        'reports': [],
+    }
+    for shard in range(job['shards']):
+        with open(queue._file('done', shard, '.json'), encoding='utf-8') as done_file:
+            shard_summary = json.load(done_file)
+        if shard_summary['worker'] not in summary['workers']:
+            summary['workers'].append(shard_summary['worker'])
+
+        # Rows are read shard by shard, only one shard's outcomes are held at a time
+        for output_name, error in manifest_rows(queue._file('manifests', shard, '.jsonl')).values():
+            summary['total'] += 1
+            if error:
+                summary['failed'].append((output_name, error))
+            else:
+                summary['successful'] += 1
+
+        if 'error' in shard_summary:
+            summary['failed_shards'].append({'shard': shard, 'error': shard_summary['error']})
+            continue
+        for key in ('cache_hits', 'cache_misses'):
+            summary[key] += shard_summary[key]
+        summary['reports'].append(shard_summary['report'])
+
+    # Shard manifests appended in row order, each starts with its own job line
+    manifest_path = Path(job['save_location']) / MANIFEST_NAME
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, 'a', encoding='utf-8') as manifest_file:
+        for shard in range(job['shards']):
+            shard_manifest = queue._file('manifests', shard, '.jsonl')
+            if shard_manifest.exists():
+                with open(shard_manifest, encoding='utf-8') as shard_file:
+                    shutil.copyfileobj(shard_file, manifest_file)
+    summary['manifest'] = str(manifest_path)
+
+    summary_path = Path(job['save_location']) / SUMMARY_NAME
+    write_json_atomic(summary_path, summary)
+    summary['summary'] = str(summary_path)
+    return summary
+
+
+def run_local(template_path, list_path, config, save_location, processes=2, queue_dir=None, **options):
+    """
+    Run a sharded job on this machine with several worker processes, the
+    queue living in a temporary directory unless queue_dir is given.
+    """
+    workers = options.pop('workers', 1)
+    temporary_queue = queue_dir is None
+    if temporary_queue:
+        queue_dir = tempfile.mkdtemp(prefix='render_queue_')
+    try:
+        create_job(queue_dir, template_path, list_path, config, save_location, **options)
+        # Spawned processes start clean on every platform
+        context = get_context('spawn')
+        worker_processes = [context.Process(target=work, args=(queue_dir, workers))
+                            for _ in range(processes)]
+        for process in worker_processes:
+            process.start()
+        for process in worker_processes:
+            process.join()
+        return merge(queue_dir)
+    finally:
+        if temporary_queue:
+            shutil.rmtree(queue_dir, ignore_errors=True)
+
+
+def add_job_arguments(parser):
+    parser.add_argument('--template', required=True, help="Template file (.docx)")
+    parser.add_argument('--list', required=True, dest='list_path', help="List file (.xlsx or .csv)")
+    parser.add_argument('--config', required=True,
+                        help="JSON file with the keyword mapping and keyword formats")
+    parser.add_argument('--output-dir', required=True, help="Save location, shared by every worker")
+    parser.add_argument('--output-formats', nargs='+', choices=OUTPUT_FORMATS,
+                        default=list(OUTPUT_FORMATS), help="Output format(s)")
+    parser.add_argument('--converter', choices=list(CONVERTERS), help="PDF converter backend")
+    parser.add_argument('--render-engine', choices=RENDER_ENGINES, default='docx',
+                        help="docx edits the document model, splice joins pre-split document.xml bytes")
+    parser.add_argument('--no-dedupe', dest='dedupe', action='store_false',
+                        help="Render every row even when its mapped values repeat an earlier row")
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE, help="Rows per shard")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Render a job in shards over a shared queue directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    init_parser = commands.add_parser('init', help="Split a job into shards in the queue directory")
+    init_parser.add_argument('--queue', required=True, help="Shared queue directory")
+    add_job_arguments(init_parser)
+
+    work_parser = commands.add_parser('work', help="Claim and render shards until none are left")
+    work_parser.add_argument('--queue', required=True, help="Shared queue directory")
+    work_parser.add_argument('--workers', type=int, default=1, help="Worker processes per shard")
+    work_parser.add_argument('--stale-after', type=float, default=DEFAULT_STALE_AFTER,
+                             help="Seconds after which an untouched claim is taken over")
+
+    merge_parser = commands.add_parser('merge', help="Combine the shard summaries and manifests")
+    merge_parser.add_argument('--queue', required=True, help="Shared queue directory")
+    merge_parser.add_argument('--wait', action='store_true', help="Wait until every shard is done")
+
+    local_parser = commands.add_parser('local', help="Run every step on this machine")
+    local_parser.add_argument('--queue', help="Queue directory, a temporary one by default")
+    local_parser.add_argument('--processes', type=int, default=2, help="Shard worker processes")
+    local_parser.add_argument('--workers', type=int, default=1, help="Render processes per shard worker")
+    add_job_arguments(local_parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    try:
+        if args.command in ('init', 'local'):
+            with open(args.config, encoding='utf-8') as config_file:
+                config = json.load(config_file)
+            options = dict(formats=args.output_formats, converter=args.converter,
+                           render_engine=args.render_engine, dedupe=args.dedupe,
+                           shard_size=args.shard_size)
+        if args.command == 'init':
+            shards = create_job(args.queue, args.template, args.list_path, config, args.output_dir, **options)
+            result = {'status': 'ok', 'queue': args.queue, 'shards': shards}
+        elif args.command == 'work':
+            finished = work(args.queue, args.workers, args.stale_after)
+            result = {'status': 'ok', 'worker': worker_name(), 'shards': finished}
+        elif args.command == 'merge':
+            result = merge(args.queue, wait=args.wait)
+        else:
+            result = run_local(args.template, args.list_path, config, args.output_dir,
+                               processes=args.processes, queue_dir=args.queue, workers=args.workers,
+                               **options)
+    except Exception as e:
+        json.dump({'status': 'error', 'error': str(e)}, sys.stdout, indent=2)
+        print()
+        return 2
+
+    if args.command in ('merge', 'local'):
+        failed = result['failed'] or result['failed_shards']
+        result['status'] = 'failed' if failed else 'ok'
+        result['failed'] = [{'name': name, 'error': error} for name, error in result['failed']]
+        json.dump(result, sys.stdout, indent=2)
+        print()
+        return 1 if failed else 0
+
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import re
+from docx import Document
+from docx.opc.oxml import serialize_part_xml
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+from package import RenderedPackage, TemplatePackage
+from render import KeywordFormats, KeywordMatcher, row_values, story_parts
+
+# Private use characters marking a slot while the template is normalized
+SLOT_START = '\ue000'
+SLOT_END = '\ue001'
+_SLOT_PATTERN = re.compile(
+    re.escape(SLOT_START.encode('utf-8')) + rb'(\d+)' + re.escape(SLOT_END.encode('utf-8')))
+
+# Characters that are not allowed anywhere in XML 1.0
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Tabs and line breaks in a value close the current w:t, like python-docx does
+_TAB = b'</w:t><w:tab/><w:t xml:space="preserve">'
+_BREAK = b'</w:t><w:br/><w:t xml:space="preserve">'
+
+
+class TemplateCompileError(Exception):
+    """Raised when a template cannot be rendered by splicing document.xml"""
+
+
+def escape_value(value):
+    """Turn a value into bytes that can be placed inside a w:t element"""
+    if _INVALID_XML_CHARS.search(value):
+        raise ValueError(
+            "All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+    value = value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    data = value.encode('utf-8')
+    if b'\t' in data:
+        data = data.replace(b'\t', _TAB)
+    if b'\r' in data or b'\n' in data:
+        data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n').replace(b'\n', _BREAK)
+    return data
+
+
+class SpliceTemplate:
+    """
+    Template whose story parts (word/document.xml, headers, footers, notes) are
+    normalized once and split into static byte segments and placeholder slots.
+    Rendering a row only escapes the mapped values and joins the segments, no
+    XML is parsed or built per row, and the other package members are written
+    without recompression.
+    Keyword formats are applied to the placeholder runs while compiling.
+    """
+
+    def __init__(self, template_path, mapping, keyword_symbols, keyword_formats=None):
+        self.template_path = template_path
+        self.mapping = mapping
+        self.keyword_formats = keyword_formats or {}
+        self.formats = KeywordFormats(self.keyword_formats)
+        self.matcher = KeywordMatcher(mapping, keyword_symbols)
+
+        self.package = TemplatePackage(template_path)
+        # (part name, segments, slot keywords) of every part holding placeholders,
+        # each part has one more segment than slots
+        self.parts = []
+        self._compile()
+
+    def _compile(self):
+        """Mark every placeholder in the template and split each story part around the marks"""
+        doc = Document(self.template_path)
+        stories = story_parts(doc)
+
+        for _, element in stories:
+            if _SLOT_PATTERN.search(serialize_part_xml(element)):
+                raise TemplateCompileError("Template already contains slot markers")
+
+        if self.matcher.pattern is None:
+            return
+
+        slot_keywords = []
+        for partname, element in stories:
+            slot_count = len(slot_keywords)
+            for p in element.iter(qn('w:p')):
+                for run in Paragraph(p, None).runs:
+                    text = run.text
+                    if not self.matcher.search(text):
+                        continue
+
+                    # Replace each placeholder by a numbered marker
+                    parts = []
+                    found = []
+                    last = 0
+                    for match in self.matcher.pattern.finditer(text):
+                        keyword = self.matcher.keywords[match.group()]
+                        parts.append(text[last:match.start()])
+                        parts.append(f"{SLOT_START}{len(slot_keywords)}{SLOT_END}")
+                        slot_keywords.append(keyword)
+                        found.append(keyword)
+                        last = match.end()
+                    self.formats.apply(run, found)
+                    parts.append(text[last:])
+                    run.text = ''.join(parts)
+
+                    # Values may start or end with spaces
+                    for t in run._r.iter(qn('w:t')):
+                        if t.text and SLOT_START in t.text:
+                            t.set(qn('xml:space'), 'preserve')
+
+            if len(slot_keywords) > slot_count:
+                pieces = _SLOT_PATTERN.split(serialize_part_xml(element))
+                self.parts.append((
+                    partname, pieces[0::2], [slot_keywords[int(index)] for index in pieces[1::2]]))
+
+    def render(self, values):
+        """Fill the template with the prepared values of one row"""
+        values = row_values(values, self.mapping)
+        escaped = {}
+
+        changed_parts = {}
+        for partname, segments, slots in self.parts:
+            parts = [segments[0]]
+            for keyword, segment in zip(slots, segments[1:]):
+                if keyword not in escaped:
+                    escaped[keyword] = escape_value(values[keyword])
+                parts.append(escaped[keyword])
+                parts.append(segment)
+            changed_parts[partname] = b''.join(parts)
+        return RenderedPackage(self.package, changed_parts)
@@ -0,0 +1,176 @@
+"""
+detect_keywords must report exactly what the original 29-pattern
+implementation reported, including the order of the keywords in
+keyword_symbols and the order of the symbol pairs of every keyword.
+The original is kept here, frozen, as the reference.
+"""
+import random
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from engine import detect_keywords  # noqa: E402
+
+
+def reference_detect_keywords(text):
+    """The implementation detect_keywords replaced, unchanged"""
+    patterns = [
+        # Double symbol with closing pair
+        (r'\$\$(.+?)\$\$', '$$', '$$'),       # $$keyword$$
+        (r'##(.+?)##', '##', '##'),           # ##keyword##
+        (r'@@(.+?)@@', '@@', '@@'),           # @@keyword@@
+        (r'\|\|(.+?)\|\|', '||', '||'),       # ||keyword||
+
+        # Single symbol with closing pair
+        (r'\$(.+?)\$', '$', '$'),             # $keyword$
+        (r'#(.+?)#', '#', '#'),               # #keyword#
+        (r'@(.+?)@', '@', '@'),               # @keyword@
+        (r'\|(.+?)\|', '|', '|'),             # |keyword|
+
+        # Double symbol without closing
+        (r'\$\$(.+?)(?:\s|$)', '$$', None),   # $$keyword
+        (r'\|\|(.+?)(?:\s|$)', '||', None),   # ||keyword
+        (r'@@(.+?)(?:\s|$)', '@@', None),     # @@keyword
+
+        # Single symbol without closing
+        (r'\$(.+?)(?:\s|$)', '$', None),      # $keyword
+        (r'\|(.+?)(?:\s|$)', '|', None),      # |keyword
+        (r'@(.+?)(?:\s|$)', '@', None),       # @keyword
+
+        # Double brackets
+        (r'\{\{(.+?)\}\}', '{{', '}}'),       # {{keyword}}
+        (r'\[\[(.+?)\]\]', '[[', ']]'),       # [[keyword]]
+        (r'\(\((.+?)\)\)', '((', '))'),       # ((keyword))
+
+        # Single brackets
+        (r'\{(.+?)\}', '{', '}'),             # {keyword}
+        (r'\[(.+?)\]', '[', ']'),             # [keyword]
+        (r'\((.+?)\)', '(', ')'),             # (keyword)
+
+        # Mixed formats - brackets with symbols
+        (r'\{\$(.+?)\$\}', '{$', '$}'),       # {$keyword$}
+        (r'\{#(.+?)#\}', '{#', '#}'),         # {#keyword#}
+        (r'\[#(.+?)#\]', '[#', '#]'),         # [#keyword#]
+        (r'\[\$(.+?)\$\]', '[$', '$]'),       # [$keyword$]
+        (r'\(#(.+?)#\)', '(#', '#)'),         # (#keyword#)
+        (r'\(\$(.+?)\$\)', '($', '$)'),       # ($keyword$)
+
+        # Double symbols with brackets
+        (r'\{\$\$(.+?)\$\$\}', '{$$', '$$}'), # {$$keyword$$}
+        (r'\[##(.+?)##\]', '[##', '##]'),     # [##keyword##]
+        (r'\(##(.+?)##\)', '(##', '##)'),     # (##keyword##)
+    ]
+
+    # Email pattern for filtering
+    email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
+    email_addresses = set(re.findall(email_pattern, text))
+
+    keyword_symbols = {}  # Store original symbols for each keyword
+
+    def is_valid_keyword(keyword, raw_match):
+        # Remove extra whitespace
+        keyword = keyword.strip()
+        if not keyword:
+            return False
+
+        # Check if the keyword is part of an email address
+        if any(keyword in email for email in email_addresses):
+            return False
+
+        # Check if the raw match (including symbols) is an email address
+        if raw_match in email_addresses:
+            return False
+
+        # Only accept digits
+        return keyword.isdigit()
+
+    for pattern, start_symbol, end_symbol in patterns:
+        matches = re.finditer(pattern, text)
+        for match in matches:
+            # Get the keyword inside the symbols
+            keyword = match.group(1).strip()
+            raw_match = match.group(0).strip()
+
+            # Only add keyword if it meets the validation criteria
+            if is_valid_keyword(keyword, raw_match):
+                if keyword not in keyword_symbols:
+                    keyword_symbols[keyword] = []
+                # Only store if it's a complete bracket pair or a special symbol
+                if (start_symbol and end_symbol) or start_symbol in ['$$', '||', '@@', '$', '|', '@']:
+                    keyword_symbols[keyword].append((start_symbol, end_symbol))
+
+    return list(set(keyword_symbols.keys())), keyword_symbols  # Return unique keywords
+
+
+FIXED_CORPUS = [
+    "",
+    "No keywords here",
+    "Dear $$1$$, your order ##2## ships to @@3@@ on ||4||",
+    "$1$ #2# @3@ |4| $$5 ||6 @@7 $8 |9 @10",
+    "{{11}} [[12]] ((13)) {14} [15] (16)",
+    "{$17$} {#18#} [#19#] [$20$] (#21#) ($22$)",
+    "{$$23$$} [##24##] (##25##)",
+    "{$$ 26 $$} and {$ 27 $} with spaces inside",
+    "{$$28$} {$29$$} $$30$}",
+    "Mail john123@example.com or @123@ or 123@test.org",
+    "Write to a1b2@mail.co, keyword @12@ and $1$",
+    "Unclosed {31 and [32 and (33 and {{34} and [[35]",
+    "Unclosed $36 and #37 and @@38 and ||39",
+    "Line one {40\n41} line two\n$42$ on line three\n|43",
+    "$44\n$45$\n\n  $$46$$  \n",
+    "Arabic {٣} Devanagari [७] superscript (²) fullwidth $１$",
+    "Mixed ٣4 {٣4} and $²$ and {1²}",
+    "Letters {a1} [1a] (1 2) $1_2$ and #1.5#",
+    "$$$1$$$ ###2### @@@3@@@ |||4|||",
+    "{{{5}}} [[[6]]] (((7)))",
+    "Tab\t$8\tand\tvertical\x0b$9\x0bend",
+    "$10$$11$ #12##13# {14}{15} [16][17]",
+    "Repeated {1} {1} [1] $1$ $$1$$ {{1}}",
+    "Order {3} $2$ [1] #3# @2@ (1)",
+    "price $5 and $10.50 and (555) 123-4567",
+    "email@123.com {123} test@example.com",
+]
+
+
+def _assert_same(text):
+    keywords, keyword_symbols = detect_keywords(text)
+    reference_keywords, reference_symbols = reference_detect_keywords(text)
+    # The old keyword list came from a set, only its contents are defined
+    assert sorted(keywords) == sorted(reference_keywords), repr(text)
+    assert list(keyword_symbols.items()) == list(reference_symbols.items()), repr(text)
+
+
+@pytest.mark.parametrize('text', FIXED_CORPUS)
+def test_fixed_corpus(text):
+    _assert_same(text)
+
+
+def test_fixed_corpus_finds_keywords():
+    # Guards against a corpus that only compares empty results
+    assert sum(len(detect_keywords(text)[0]) for text in FIXED_CORPUS) > 50
+
+
+# Pieces random texts are assembled from, weighted towards symbols and digits
+_PIECES = (
+    list('$#@|{}[]()') * 3
+    + ['$$', '##', '@@', '||', '{{', '}}', '[[', ']]', '((', '))', '{$', '$}', '{$$', '$$}', '[##', '##]']
+    + list('0123456789') * 3
+    + ['12', '345', '٣', '७', '²', '１']
+    + list('abcxyz._%+-')
+    + [' ', ' ', '  ', '\t', '\n', '\n', '\r\n']
+    + ['john@example.com', 'a1@b2.io', '12@34.org', 'x.y+3@mail-9.co.uk', '.com', '@x.']
+)
+
+
+def _random_text(generator):
+    return ''.join(generator.choice(_PIECES) for _ in range(generator.randint(0, 40)))
+
+
+def test_random_corpus():
+    generator = random.Random(20260601)
+    for _ in range(20000):
+        _assert_same(_random_text(generator))
@@ -0,0 +1,63 @@
+"""
+TemplatePackage writes every output file with its own ZIP writer, the
+result must be a valid ZIP that python-docx and Word can open.
+"""
+import io
+import sys
+import zipfile
+from pathlib import Path
+
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from package import TemplatePackage  # noqa: E402
+
+DOCUMENT_PART = 'word/document.xml'
+
+
+def make_template(path):
+    document = Document()
+    document.add_paragraph("Dear {1},")
+    document.add_paragraph("Ünïcödé stays intact")
+    document.sections[0].header.paragraphs[0].text = "Header"
+    document.save(path)
+
+
+def test_written_package_is_a_valid_docx(tmp_path):
+    template_path = tmp_path / 'template.docx'
+    make_template(template_path)
+    with zipfile.ZipFile(template_path) as template:
+        names = template.namelist()
+        original = {name: template.read(name) for name in names}
+
+    changed = original[DOCUMENT_PART].replace(b'{1}', 'Zoë &amp; Ann'.encode('utf-8'))
+    output_path = tmp_path / 'output.docx'
+    TemplatePackage(template_path).write(output_path, {DOCUMENT_PART: changed})
+
+    with zipfile.ZipFile(output_path) as output:
+        assert output.testzip() is None
+        assert output.namelist() == names
+        for name in names:
+            expected = changed if name == DOCUMENT_PART else original[name]
+            assert output.read(name) == expected, name
+
+    paragraphs = [paragraph.text for paragraph in Document(output_path).paragraphs]
+    assert paragraphs == ["Dear Zoë & Ann,", "Ünïcödé stays intact"]
+    assert Document(output_path).sections[0].header.paragraphs[0].text == "Header"
+
+
+def test_package_reads_and_writes_file_objects(tmp_path):
+    template_path = tmp_path / 'template.docx'
+    make_template(template_path)
+
+    buffer = io.BytesIO()
+    TemplatePackage(template_path).write(buffer, {})
+    # A package read back from memory writes the same bytes again
+    again = io.BytesIO()
+    TemplatePackage(io.BytesIO(buffer.getvalue())).write(again, {})
+    assert again.getvalue() == buffer.getvalue()
+
+    with zipfile.ZipFile(io.BytesIO(buffer.getvalue())) as output:
+        assert output.testzip() is None
+    assert Document(io.BytesIO(buffer.getvalue())).paragraphs[0].text == "Dear {1},"
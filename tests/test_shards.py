@@ -0,0 +1,101 @@
+"""
+Sharded runs on one machine: run_local with worker processes, claiming, the
+takeover of a stale claim and the merged summary.
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import shards  # noqa: E402
+
+ROWS = 23
+CONFIG = {'mapping': {'1': 'A', '2': 'B'}}
+
+
+def make_job_files(tmp_path):
+    template_path = tmp_path / 'template.docx'
+    document = Document()
+    document.add_paragraph("Dear {1}, your number is {2}.")
+    document.save(template_path)
+
+    list_path = tmp_path / 'list.csv'
+    lines = ["Name,Folder,A,B"] + [f"P{row},g{row % 3},a{row},{row:04d}" for row in range(ROWS)]
+    list_path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return template_path, list_path
+
+
+def output_files(save_location):
+    return sorted(path.relative_to(save_location).as_posix()
+                  for path in Path(save_location).rglob('*.docx'))
+
+
+def test_run_local_renders_every_row(tmp_path):
+    template_path, list_path = make_job_files(tmp_path)
+    save_location = tmp_path / 'out'
+
+    summary = shards.run_local(template_path, list_path, CONFIG, save_location, processes=2,
+                               formats=['docx'], shard_size=5)
+
+    assert summary['shards'] == 5
+    assert summary['total'] == ROWS
+    assert summary['successful'] == ROWS
+    assert summary['failed'] == []
+    assert summary['failed_shards'] == []
+    assert output_files(save_location) == sorted(
+        f"g{row % 3}/docx/P{row}.docx" for row in range(ROWS))
+    paragraph = Document(save_location / 'g1' / 'docx' / 'P7.docx').paragraphs[0].text
+    assert paragraph == "Dear a7, your number is 0007."
+
+
+def test_stale_claim_is_taken_over_and_merged(tmp_path):
+    template_path, list_path = make_job_files(tmp_path)
+    save_location = tmp_path / 'out'
+    queue_dir = tmp_path / 'queue'
+    shards.create_job(queue_dir, template_path, list_path, CONFIG, save_location,
+                      formats=['docx'], shard_size=10)
+    queue = shards.ShardQueue(queue_dir)
+
+    # A worker renders shard 0 and dies before completing it
+    assert queue.claim('crashed') == (0, False)
+    queue.run_shard(0, 'crashed')
+    lock_path = queue._file('claims', 0, '.lock')
+    old = time.time() - 60
+    os.utime(lock_path, (old, old))
+
+    assert shards.work(queue_dir, stale_after=5, worker='rescuer') == [0, 1, 2]
+    assert queue.owner(0) is None
+
+    summary = shards.merge(queue_dir)
+    # The rows the crashed worker finished count as successful, not skipped
+    assert summary['total'] == ROWS
+    assert summary['successful'] == ROWS
+    assert summary['failed'] == []
+    assert summary['workers'] == ['rescuer']
+    assert len(output_files(save_location)) == ROWS
+
+
+def test_fresh_claim_survives_a_late_takeover(tmp_path, monkeypatch):
+    template_path, list_path = make_job_files(tmp_path)
+    queue_dir = tmp_path / 'queue'
+    shards.create_job(queue_dir, template_path, list_path, CONFIG, tmp_path / 'out',
+                      formats=['docx'], shard_size=ROWS)
+    queue = shards.ShardQueue(queue_dir)
+    assert queue.claim('first') == (0, False)
+
+    # The lock looked stale when checked, but a fresh one was created before the rename
+    real_is_stale = queue._is_stale
+    checks = []
+
+    def is_stale(lock_path, stale_after):
+        checks.append(lock_path)
+        return True if len(checks) == 1 else real_is_stale(lock_path, stale_after)
+
+    monkeypatch.setattr(queue, '_is_stale', is_stale)
+    assert queue.claim('second') == (None, False)
+    assert queue.owner(0) == 'first'
+    assert list(queue._file('claims', 0, '.lock').parent.iterdir()) == [queue._file('claims', 0, '.lock')]